@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import metrics
+
+# Один выделенный поток под SQLite: у него своё долгоживущее соединение
+# (см. database.get_conn), записи сериализуются, а event loop не ждёт диск.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run(func, *args, **kwargs):
+    """Выполнить синхронную функцию БД в потоке БД и дождаться результата.
+
+    Функция видит contextvars вызывающего (в т.ч. текущего бота, см. tenants).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+    finally:
+        metrics.observe("bot_db_seconds", getattr(func, "__name__", "call"), time.perf_counter() - started)
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    """Дождаться оставшихся запросов и закрыть соединения."""
+    _executor.submit(database.close_all).result()
+    _executor.shutdown(wait=True)
+
+
+# ---------- COUNTERS ----------
+get_counters = _wrap(database.get_counters)
+content_version = _wrap(database.content_version)
+
+# ---------- GREETING ----------
+save_greeting = _wrap(database.save_greeting)
+get_greeting = _wrap(database.get_greeting)
+
+# ---------- REVIEWS ----------
+add_review = _wrap(database.add_review)
+list_reviews = _wrap(database.list_reviews)
+page_reviews = _wrap(database.page_reviews)
+count_reviews = _wrap(database.count_reviews)
+get_review_by_id = _wrap(database.get_review_by_id)
+delete_review = _wrap(database.delete_review)
+
+# ---------- SERVICES ----------
+add_service = _wrap(database.add_service)
+list_services = _wrap(database.list_services)
+page_services = _wrap(database.page_services)
+count_services = _wrap(database.count_services)
+get_service_by_id = _wrap(database.get_service_by_id)
+delete_service = _wrap(database.delete_service)
+
+# ---------- GIFTS ----------
+add_gift = _wrap(database.add_gift)
+list_gifts = _wrap(database.list_gifts)
+page_gifts = _wrap(database.page_gifts)
+count_gifts = _wrap(database.count_gifts)
+get_gift_by_id = _wrap(database.get_gift_by_id)
+delete_gift = _wrap(database.delete_gift)
+
+# ---------- SEARCH ----------
+search = _wrap(database.search)
+
+# ---------- FILE IDS ----------
+get_file_id = _wrap(database.get_file_id)
+save_file_id = _wrap(database.save_file_id)
+forget_file_id = _wrap(database.forget_file_id)
+forget_file_ids_for = _wrap(database.forget_file_ids_for)
+
+# ---------- MEDIA ----------
+referenced_media = _wrap(database.referenced_media)
+
+# ---------- FSM ----------
+fsm_get = _wrap(database.fsm_get)
+fsm_set_state = _wrap(database.fsm_set_state)
+fsm_set_data = _wrap(database.fsm_set_data)
+fsm_update_data = _wrap(database.fsm_update_data)
+fsm_apply = _wrap(database.fsm_apply)
+
+# ---------- USERS ----------
+upsert_users = _wrap(database.upsert_users)
+users_after = _wrap(database.users_after)
+
+# ---------- BROADCASTS ----------
+create_broadcast = _wrap(database.create_broadcast)
+get_broadcast = _wrap(database.get_broadcast)
+running_broadcasts = _wrap(database.running_broadcasts)
+claim_broadcast = _wrap(database.claim_broadcast)
+renew_broadcast = _wrap(database.renew_broadcast)
+set_broadcast_report = _wrap(database.set_broadcast_report)
+broadcast_progress = _wrap(database.broadcast_progress)
+finish_broadcast = _wrap(database.finish_broadcast)
+
+# ---------- EVENTS ----------
+log_events = _wrap(database.log_events)
+roll_up_events = _wrap(database.roll_up_events)
+analytics_summary = _wrap(database.analytics_summary)
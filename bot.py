@@ -1,15 +1,133 @@
 import asyncio
+import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    BOTS_CONFIG, BOT_MODE, BOT_MODES,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS,
+    METRICS_HOST, METRICS_PORT, METRICS_PATH,
+)
 from handlers import router
 from database import init_db  # 👈 это важно
+import async_db
+import broadcast
+import catalog
+import events
+import images
+import media_gc
+import metrics
+import send_scheduler
+import tenants
+import users
+from fsm_storage import SQLiteStorage
+
+
+def build_webhook_app(dp: Dispatcher, bots: list[tuple[tenants.Tenant, Bot]]) -> web.Application:
+    """aiohttp-приложение, принимающее апдейты на WEBHOOK_PATH.
+
+    Один бот — ровно на WEBHOOK_PATH, несколько — на WEBHOOK_PATH/<имя бота>.
+    Ответ 200 отдаётся сразу, апдейт обрабатывается в фоне.
+    Запросы без верного секрета отклоняются (401).
+    """
+    app = web.Application()
+    for tenant, bot in bots:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            handle_in_background=True,
+            secret_token=WEBHOOK_SECRET or None,
+        ).register(app, path=_webhook_path(tenant, len(bots)))
+    setup_application(app, dp, bots=[bot for _, bot in bots])
+    return app
+
+
+def _webhook_path(tenant: tenants.Tenant, count: int) -> str:
+    return WEBHOOK_PATH if count == 1 else f"{WEBHOOK_PATH}/{tenant.name}"
+
+
+async def run_webhook(dp: Dispatcher, bots: list[tuple[tenants.Tenant, Bot]]):
+    if WEBHOOK_URL:
+        for tenant, bot in bots:
+            await bot.set_webhook(
+                WEBHOOK_URL + _webhook_path(tenant, len(bots)),
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+    runner = web.AppRunner(build_webhook_app(dp, bots))
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def check_mode():
+    """Не стартовать с опечаткой в BOT_MODE или с публичным вебхуком без секрета."""
+    if BOT_MODE not in BOT_MODES:
+        raise SystemExit(f"BOT_MODE={BOT_MODE!r}: expected one of {', '.join(BOT_MODES)}")
+    if BOT_MODE != "webhook" or WEBHOOK_SECRET:
+        return
+    if WEBHOOK_URL:
+        raise SystemExit("WEBHOOK_SECRET is required when WEBHOOK_URL is set")
+    logging.warning("WEBHOOK_SECRET is empty: incoming webhook requests are not authenticated")
+
+
+def _start_background(bot: Bot) -> list[asyncio.Task]:
+    """Фоновые задачи одного бота; вызывается в его контексте (tenants.use)."""
+    return [
+        asyncio.create_task(catalog.watch()),
+        asyncio.create_task(media_gc.run_forever()),
+        asyncio.create_task(users.run_flusher()),
+        asyncio.create_task(events.run_forever()),
+        asyncio.create_task(broadcast.run_forever(bot)),
+    ]
+
 
 async def main():
-    init_db()  # 👈 инициализация базы данных
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    check_mode()
+    # Одна HTTP-сессия (и один планировщик отправок) на все боты процесса
+    session = AiohttpSession()
+    session.middleware(send_scheduler.scheduler)  # темп отправок и повтор после 429
+    session.middleware(metrics.ApiMetricsMiddleware())  # после планировщика: меряем сам запрос
+
+    bots: list[tuple[tenants.Tenant, Bot]] = []
+    background: list[asyncio.Task] = []
+    for tenant in tenants.load(BOTS_CONFIG):
+        with tenants.use(tenant):
+            await async_db.run(init_db)  # 👈 инициализация базы данных (в потоке БД)
+            await async_db.run(catalog.rebuild)  # снимок контента для пользовательских экранов
+            bot = Bot(token=tenant.token, session=session)
+            tenants.bind(bot, tenant)
+            bots.append((tenant, bot))
+            background += _start_background(bot)
+
+    dp = tenants.TenantDispatcher(storage=SQLiteStorage())
     dp.include_router(router)
-    await dp.start_polling(bot)
+    metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT, METRICS_PATH) if METRICS_PORT else None
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bots)
+        else:
+            for _, bot in bots:
+                await bot.delete_webhook()
+            await dp.start_polling(*(bot for _, bot in bots))
+    finally:
+        for task in background:
+            task.cancel()
+        for tenant, _ in bots:
+            with tenants.use(tenant):
+                await users.flush()
+                await events.flush()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await session.close()
+        images.shutdown()
+        async_db.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,188 @@
+"""Рассылка сообщения всем пользователям из реестра (users).
+
+Сообщение админа копируется (copyMessage) каждому получателю пулом из
+WORKERS корутин с фоновым приоритетом send_scheduler — ответы
+пользователям при этом идут первыми. Получатели берутся пачками по
+user_id; после каждой пачки прогресс и курсор пишутся в broadcasts, так
+что после падения рассылка продолжится с места остановки (повторно может
+уйти не больше одной пачки). Заблокировавшие бота помечаются в users и
+дальше не получают рассылок.
+
+Рассылку ведёт тот процесс, который её захватил (lease_owner, lease_until).
+Пока он жив, аренда продлевается по таймеру — даже если пачка идёт дольше
+LEASE; если он умер, аренда истекает и рассылку подхватывает run_forever
+любого процесса. Потерявший аренду процесс сразу прекращает отправку,
+а его прогресс не записывается.
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+
+import async_db
+import send_scheduler
+import tenants
+import users
+from keyboards import get_broadcast_stop_keyboard
+
+BATCH_SIZE = 500          # получателей за один шаг (и максимум повторов после падения)
+WORKERS = 25              # одновременных copyMessage (темп всё равно задаёт send_scheduler)
+LEASE = 120               # сек, аренда рассылки процессом
+RENEW_INTERVAL = 30       # как часто продлевать аренду, пока рассылка идёт
+REPORT_INTERVAL = 5.0     # как часто обновлять сообщение с прогрессом
+RESUME_INTERVAL = 60.0    # как часто искать брошенные рассылки
+
+_running: dict[tuple[str, int], asyncio.Task] = {}   # (имя бота, id рассылки) -> задача
+
+
+def progress_text(b) -> str:
+    done = b.sent + b.failed + b.blocked
+    title = {
+        "running": "📣 <b>Рассылка идёт</b>",
+        "done": "✅ <b>Рассылка завершена</b>",
+        "cancelled": "⏹ <b>Рассылка остановлена</b>",
+    }.get(b.status, "📣 <b>Рассылка</b>")
+    return (
+        f"{title}\n\n"
+        f"Обработано: <b>{done}</b> из <b>{b.total}</b>\n"
+        f"✅ Доставлено: <b>{b.sent}</b>\n"
+        f"🚫 Заблокировали бота: <b>{b.blocked}</b>\n"
+        f"⚠️ Ошибок: <b>{b.failed}</b>"
+    )
+
+
+async def start(bot: Bot, from_chat_id: int, message_id: int, report_chat_id: int) -> int:
+    """Создать рассылку и запустить её в фоне. Вернёт id рассылки."""
+    await users.flush()  # чтобы в рассылку попали и только что пришедшие
+    broadcast_id = await async_db.create_broadcast(from_chat_id, message_id, report_chat_id)
+    b = await async_db.get_broadcast(broadcast_id)
+    report = await bot.send_message(
+        report_chat_id, progress_text(b),
+        parse_mode="HTML", reply_markup=get_broadcast_stop_keyboard(broadcast_id)
+    )
+    await async_db.set_broadcast_report(broadcast_id, report.message_id)
+    _spawn(bot, broadcast_id)
+    return broadcast_id
+
+
+async def stop(broadcast_id: int):
+    """Остановить рассылку (воркеры заметят это при продлении аренды или после текущей пачки)."""
+    await async_db.finish_broadcast(broadcast_id, "cancelled")
+
+
+def _spawn(bot: Bot, broadcast_id: int):
+    key = (tenants.current().name, broadcast_id)
+    task = _running.get(key)
+    if task is None or task.done():
+        task = _running[key] = asyncio.create_task(_run(bot, broadcast_id))
+        task.add_done_callback(lambda _: _running.pop(key, None))
+
+
+async def run_forever(bot: Bot, interval: float = RESUME_INTERVAL):
+    """Фоновая задача бота: подхватывает незавершённые рассылки (после рестарта или чужого падения)."""
+    while True:
+        try:
+            for broadcast_id in await async_db.running_broadcasts():
+                _spawn(bot, broadcast_id)
+        except Exception:
+            logging.exception("broadcast resume failed")
+        await asyncio.sleep(interval)
+
+
+async def _deliver(bot: Bot, b, user_id: int) -> str:
+    try:
+        with send_scheduler.background():
+            await bot.copy_message(user_id, b.from_chat_id, b.message_id)
+        return "sent"
+    except TelegramForbiddenError:
+        return "blocked"   # заблокировал бота или удалил аккаунт
+    except TelegramAPIError:
+        return "failed"
+
+
+async def _fan_out(bot: Bot, b, batch: list[int], lost: asyncio.Event) -> list[str]:
+    """Разослать пачку; "" в результате — до получателя не дошли (аренда потеряна)."""
+    results = [""] * len(batch)
+    queue = iter(enumerate(batch))
+
+    async def worker():
+        for i, user_id in queue:
+            if lost.is_set():
+                return
+            results[i] = await _deliver(bot, b, user_id)
+
+    await asyncio.gather(*(worker() for _ in range(min(WORKERS, len(batch)))))
+    return results
+
+
+async def _report(bot: Bot, broadcast_id: int):
+    b = await async_db.get_broadcast(broadcast_id)
+    if b is None or b.report_message_id is None:
+        return
+    kb = get_broadcast_stop_keyboard(broadcast_id) if b.status == "running" else None
+    try:
+        await bot.edit_message_text(
+            progress_text(b), chat_id=b.report_chat_id, message_id=b.report_message_id,
+            parse_mode="HTML", reply_markup=kb
+        )
+    except TelegramBadRequest:
+        pass  # сообщение удалили или текст не изменился
+
+
+async def _hold_lease(broadcast_id: int, owner: str, lost: asyncio.Event):
+    """Продлевать аренду по таймеру; не удалось до её истечения — выставить lost."""
+    held_until = time.monotonic() + LEASE
+    while True:
+        await asyncio.sleep(RENEW_INTERVAL)
+        try:
+            if not await async_db.renew_broadcast(broadcast_id, owner, LEASE):
+                break  # остановлена админом или перехвачена другим процессом
+            held_until = time.monotonic() + LEASE
+        except Exception:
+            logging.exception("broadcast %s lease renewal failed", broadcast_id)
+            if time.monotonic() + RENEW_INTERVAL >= held_until:
+                break  # до следующей попытки аренда может истечь
+    lost.set()
+
+
+async def _run(bot: Bot, broadcast_id: int):
+    owner = uuid.uuid4().hex
+    if not await async_db.claim_broadcast(broadcast_id, owner, LEASE):
+        return  # уже ведёт другой процесс
+    b = await async_db.get_broadcast(broadcast_id)
+    cursor, status = b.cursor, b.status
+    reported = time.monotonic()
+    lost = asyncio.Event()
+    keeper = asyncio.create_task(_hold_lease(broadcast_id, owner, lost))
+    try:
+        while status == "running" and not lost.is_set():
+            batch = await async_db.users_after(cursor, BATCH_SIZE)
+            if not batch:
+                await async_db.finish_broadcast(broadcast_id, "done", owner)
+                break
+            results = await _fan_out(bot, b, batch, lost)
+            # Курсор двигаем только по сплошь обработанному началу пачки
+            done = results.index("") if "" in results else len(results)
+            if not done:
+                break
+            results, cursor = results[:done], batch[done - 1]
+            blocked = [user_id for user_id, r in zip(batch, results) if r == "blocked"]
+            status = await async_db.broadcast_progress(
+                broadcast_id, owner, cursor, results.count("sent"), results.count("failed"), blocked, LEASE
+            )
+            if status is None:
+                logging.warning("broadcast %s lease lost, stopping", broadcast_id)
+                return
+            if time.monotonic() - reported >= REPORT_INTERVAL:
+                await _report(bot, broadcast_id)
+                reported = time.monotonic()
+    except Exception:
+        # Аренда истечёт, и run_forever продолжит рассылку с последней пачки
+        logging.exception("broadcast %s interrupted", broadcast_id)
+        return
+    finally:
+        keeper.cancel()
+    await _report(bot, broadcast_id)
@@ -0,0 +1,260 @@
+"""Компактные callback_data и маршрутизация по коду операции.
+
+Формат: `<версия><код>[:<поле>...]`, числа — в base36, курсор страницы
+`n1722500000_123` сжимается до `nshj5i8.3f`. Например `1S:3f:2:nshj5i8.3f` —
+«открыть услугу 123, «Назад» — на страницу 2». Всё укладывается в 64 байта Telegram.
+
+Хендлер получает уже разобранный и проверенный payload (NamedTuple),
+а выбор хендлера — один поиск в словаре по коду, без перебора фильтров:
+
+    buttons = CallbackDispatcher(router)
+
+    @buttons.on(U_SERVICE)
+    async def u_service_open(callback: CallbackQuery, payload: ItemArgs): ...
+
+Кнопки старого формата или другой версии, как и кнопки уже закончившегося
+мастера, не обрабатываются — пользователь получает «кнопка устарела».
+Меняя смысл полей, увеличивайте VERSION.
+"""
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery, TelegramObject
+
+from database import make_cursor, parse_cursor
+
+VERSION = "1"
+SEP = ":"
+MAX_LENGTH = 64  # лимит Telegram на callback_data, байт
+STALE_TEXT = "Кнопка устарела — откройте раздел заново."
+
+
+# ---------- Payload'ы ----------
+
+class NoArgs(NamedTuple):
+    pass
+
+
+class IdArgs(NamedTuple):
+    item_id: int
+
+
+class PageArgs(NamedTuple):
+    page: int = 0
+    cursor: str | None = None
+
+
+class ItemArgs(NamedTuple):
+    item_id: int
+    page: int = 0
+    cursor: str | None = None
+
+
+# ---------- Коды операций ----------
+
+# Админка
+SETTINGS = "st"
+GREETING_MENU = "gm"
+GREETING_VIEW = "gv"
+GREETING_EDIT = "ge"
+REVIEWS_MENU = "rm"
+REVIEWS_ADD = "ra"
+REVIEWS_DELETE_PAGE = "rl"
+REVIEWS_DELETE = "rd"
+SERVICES_MENU = "sm"
+SERVICES_VIEW_PAGE = "sv"
+SERVICES_ADD = "sa"
+SERVICES_DELETE_PAGE = "sl"
+SERVICES_DELETE = "sd"
+GIFTS_MENU = "pm"
+GIFTS_VIEW_PAGE = "pv"
+GIFTS_ADD = "pa"
+GIFTS_DELETE_PAGE = "pl"
+GIFTS_DELETE = "pd"
+SKIP_FILE = "sk"
+BROADCAST_NEW = "bn"
+BROADCAST_CONFIRM = "bc"
+BROADCAST_CANCEL = "bx"
+BROADCAST_STOP = "bs"
+# Пользователь — самые частые нажатия, по одной букве
+U_REVIEWS_PAGE = "r"
+U_REVIEW = "R"
+U_SERVICES_PAGE = "s"
+U_SERVICE = "S"
+U_GIFTS_PAGE = "p"
+U_GIFT = "P"
+
+OPS: dict[str, type] = {
+    SETTINGS: NoArgs,
+    GREETING_MENU: NoArgs,
+    GREETING_VIEW: NoArgs,
+    GREETING_EDIT: NoArgs,
+    REVIEWS_MENU: NoArgs,
+    REVIEWS_ADD: NoArgs,
+    REVIEWS_DELETE_PAGE: PageArgs,
+    REVIEWS_DELETE: ItemArgs,
+    SERVICES_MENU: NoArgs,
+    SERVICES_VIEW_PAGE: PageArgs,
+    SERVICES_ADD: NoArgs,
+    SERVICES_DELETE_PAGE: PageArgs,
+    SERVICES_DELETE: ItemArgs,
+    GIFTS_MENU: NoArgs,
+    GIFTS_VIEW_PAGE: PageArgs,
+    GIFTS_ADD: NoArgs,
+    GIFTS_DELETE_PAGE: PageArgs,
+    GIFTS_DELETE: ItemArgs,
+    SKIP_FILE: NoArgs,
+    BROADCAST_NEW: NoArgs,
+    BROADCAST_CONFIRM: NoArgs,
+    BROADCAST_CANCEL: NoArgs,
+    BROADCAST_STOP: IdArgs,
+    U_REVIEWS_PAGE: PageArgs,
+    U_REVIEW: ItemArgs,
+    U_SERVICES_PAGE: PageArgs,
+    U_SERVICE: ItemArgs,
+    U_GIFTS_PAGE: PageArgs,
+    U_GIFT: ItemArgs,
+}
+
+
+# ---------- Кодек ----------
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _b36(n: int) -> str:
+    if n < 0:
+        return "-" + _b36(-n)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if not n:
+            return out
+
+
+def _pack_int(value: int) -> str:
+    return _b36(value)
+
+
+def _unpack_int(raw: str) -> int:
+    return int(raw, 36)
+
+
+def _unpack_page(raw: str) -> int:
+    return max(int(raw, 36), 0)
+
+
+def _pack_cursor(cursor: str | None) -> str:
+    parsed = parse_cursor(cursor)
+    if parsed is None:
+        return ""
+    op, ts, row_id = parsed
+    return f"{op}{_b36(ts)}.{_b36(row_id)}"
+
+
+def _unpack_cursor(raw: str) -> str | None:
+    if not raw:
+        return None
+    ts, row_id = raw[1:].split(".")
+    if raw[0] not in "nfp":
+        raise ValueError(raw)
+    return make_cursor(raw[0], int(ts, 36), int(row_id, 36))
+
+
+# Поля каждого payload'а: (упаковка, распаковка)
+_INT = (_pack_int, _unpack_int)
+_PAGE = (_pack_int, _unpack_page)
+_CURSOR = (_pack_cursor, _unpack_cursor)
+_FIELDS = {
+    NoArgs: (),
+    IdArgs: (_INT,),
+    PageArgs: (_PAGE, _CURSOR),
+    ItemArgs: (_INT, _PAGE, _CURSOR),
+}
+
+
+def pack(op: str, *values) -> str:
+    """callback_data для операции op; хвостовые поля по умолчанию можно не передавать."""
+    fields = _FIELDS[OPS[op]]
+    if len(values) > len(fields):
+        raise ValueError(f"{op}: too many values")
+    parts = [encode(value) for (encode, _), value in zip(fields, values)]
+    while parts and not parts[-1]:
+        parts.pop()
+    data = SEP.join([VERSION + op, *parts])
+    if len(data.encode()) > MAX_LENGTH:
+        raise ValueError(f"callback_data too long: {data}")
+    return data
+
+
+def unpack(data: str | None) -> tuple[str, NamedTuple] | None:
+    """(код, payload) или None для чужой версии, неизвестного кода и битых полей."""
+    if not data or not data.startswith(VERSION):
+        return None
+    head, *parts = data[len(VERSION):].split(SEP)
+    payload_type = OPS.get(head)
+    if payload_type is None:
+        return None
+    fields = _FIELDS[payload_type]
+    if len(parts) > len(fields):
+        return None
+    try:
+        values = [decode(raw) for (_, decode), raw in zip(fields, parts)]
+        return head, payload_type(*values)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------- Диспетчер ----------
+
+class CallbackDispatcher:
+    """Один callback-хендлер роутера, внутри — словарь код → хендлер.
+
+    Разбор data происходит один раз в outer-middleware: дальше хендлер
+    получает payload, а метрики — его настоящее имя (handler_name).
+    """
+
+    def __init__(self, router):
+        self._routes: dict[str, tuple[CallableObject, frozenset[str] | None]] = {}
+        router.callback_query.outer_middleware(self._resolve)
+        router.callback_query.register(self._dispatch)
+
+    def on(self, *ops: str, state: State | tuple[State, ...] | None = None):
+        """Зарегистрировать хендлер на коды ops (при state — только в этом состоянии/состояниях FSM)."""
+        if isinstance(state, State):
+            state = (state,)
+        states = frozenset(s.state for s in state) if state else None
+
+        def decorator(func):
+            for op in ops:
+                if op not in OPS:
+                    raise ValueError(f"unknown callback op: {op}")
+                if op in self._routes:
+                    raise ValueError(f"callback op {op} is already handled")
+                self._routes[op] = (CallableObject(func), states)
+            return func
+        return decorator
+
+    async def _resolve(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        decoded = unpack(event.data)
+        route = self._routes.get(decoded[0]) if decoded else None
+        if route is not None and route[1] is not None and data.get("raw_state") not in route[1]:
+            route = None  # кнопка мастера, который уже закончился
+        data["route"] = route
+        data["payload"] = decoded[1] if decoded else None
+        data["handler_name"] = route[0].callback.__name__ if route else "stale_callback"
+        return await handler(event, data)
+
+    async def _dispatch(self, callback: CallbackQuery, **data):
+        route = data.pop("route")
+        if route is None:
+            await callback.answer(STALE_TEXT, show_alert=True)
+            return
+        return await route[0].call(callback, **data)
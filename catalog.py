@@ -0,0 +1,135 @@
+import asyncio
+import bisect
+import logging
+from dataclasses import dataclass
+
+import async_db
+import database
+import tenants
+from database import Page, make_cursor, parse_cursor
+
+# Как часто проверять, не поменял ли контент другой процесс бота
+REFRESH_INTERVAL = 2.0
+
+
+@dataclass(frozen=True)
+class Section:
+    """Неизменяемый срез раздела: строки в порядке показа + индекс по id."""
+    rows: tuple        # (id, ...) в порядке created_ts DESC, id DESC
+    keys: tuple        # (-epoch, -id) по возрастанию — для bisect по курсору
+    by_id: dict        # id -> позиция в rows
+
+    @classmethod
+    def build(cls, raw_rows) -> "Section":
+        rows = tuple(tuple(r[:-1]) for r in raw_rows)
+        keys = tuple((-r[-1], -r[0]) for r in raw_rows)
+        return cls(rows, keys, {r[0]: i for i, r in enumerate(rows)})
+
+    @property
+    def total(self) -> int:
+        return len(self.rows)
+
+    def get(self, item_id: int):
+        i = self.by_id.get(item_id)
+        return None if i is None else self.rows[i]
+
+    def locate(self, page: int = 0, cursor: str | None = None, limit: int = 5) -> tuple[int, int]:
+        """(позиция первой строки, номер страницы) для запроса страницы; курсор — бинарным поиском."""
+        parsed = parse_cursor(cursor)
+        if parsed is None:
+            return page * limit, page
+        op, ts, row_id = parsed
+        key = (-ts, -row_id)
+        if op == "n":
+            return bisect.bisect_right(self.keys, key), page
+        if op == "f":
+            return bisect.bisect_left(self.keys, key), page
+        start = bisect.bisect_left(self.keys, key) - limit
+        return (start, page) if start > 0 else (0, 0)
+
+    def window(self, start: int, page: int, limit: int = 5) -> Page:
+        """Страница из строк [start, start + limit)."""
+        end = min(start + limit, len(self.rows))
+        if start >= end:
+            return Page([], page, None, None, None, self.total)
+
+        first, last = self.keys[start], self.keys[end - 1]
+        return Page(
+            items=self.rows[start:end],
+            page=page,
+            prev_cursor=make_cursor("p", -first[0], -first[1]) if start > 0 else None,
+            next_cursor=make_cursor("n", -last[0], -last[1]) if end < len(self.rows) else None,
+            anchor=make_cursor("f", -first[0], -first[1]),
+            total=self.total,
+        )
+
+    def page(self, page: int = 0, cursor: str | None = None, limit: int = 5) -> Page:
+        """То же, что database.page_*, но из памяти."""
+        start, page = self.locate(page, cursor, limit)
+        return self.window(start, page, limit)
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: int              # локальная версия снимка (растёт при каждой пересборке)
+    db_version: int           # counters.content_version, из которой снимок собран
+    greeting: tuple | None    # (photo_path, text)
+    reviews: Section
+    services: Section
+    gifts: Section
+
+
+_EMPTY = Section((), (), {})
+_INITIAL = Catalog(0, -1, None, _EMPTY, _EMPTY, _EMPTY)
+_snapshots: dict[str, Catalog] = {}   # имя бота -> снимок его контента
+_rebuild_listeners = []
+
+
+def current() -> Catalog:
+    """Текущий снимок каталога текущего бота (читается без обращения к БД)."""
+    return _snapshots.get(tenants.current().name, _INITIAL)
+
+
+def on_rebuild(callback):
+    """Зарегистрировать callback(snapshot), вызываемый для каждого нового снимка до его публикации."""
+    _rebuild_listeners.append(callback)
+    return callback
+
+
+@database.on_change
+def rebuild():
+    """Перечитать контент из БД и атомарно подменить снимок.
+
+    Вызывается в потоке БД после каждой записи (см. database.on_change)
+    и один раз при старте бота.
+    """
+    snapshot = Catalog(
+        version=current().version + 1,
+        db_version=database.content_version(),
+        greeting=database.get_greeting(),
+        reviews=Section.build(database.snapshot_rows("reviews")),
+        services=Section.build(database.snapshot_rows("services")),
+        gifts=Section.build(database.snapshot_rows("gifts")),
+    )
+    for callback in _rebuild_listeners:
+        try:
+            callback(snapshot)
+        except Exception:
+            logging.exception("catalog rebuild listener failed")
+    _snapshots[tenants.current().name] = snapshot
+
+
+def refresh_if_stale():
+    """Пересобрать снимок, если контент менял другой процесс (одна строка из counters)."""
+    if database.content_version() != current().db_version:
+        rebuild()
+
+
+async def watch():
+    """Фоновая задача: держит снимок свежим, когда ботов запущено несколько."""
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            await async_db.run(refresh_if_stale)
+        except Exception:
+            logging.exception("catalog refresh failed")
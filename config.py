@@ -17,3 +17,29 @@ if not ADMIN_IDS and os.getenv("ADMIN_ID"):
 # URL для кнопки «Контакты»
 CONTACT_URL = os.getenv("CONTACT_URL", "https://t.me/your_contact_here")
 CONTACT_BUTTON_TEXT = os.getenv("CONTACT_BUTTON_TEXT", "Перейти")
+
+# Режим получения апдейтов: "polling" (по умолчанию) или "webhook"
+BOT_MODES = ("polling", "webhook")
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+
+# Вебхук: публичный адрес (без пути), путь и секрет для заголовка
+# X-Telegram-Bot-Api-Secret-Token. Если WEBHOOK_URL пуст, бот только
+# поднимает сервер и не регистрирует вебхук в Telegram (удобно за балансировщиком
+# и при локальной проверке). С WEBHOOK_URL секрет обязателен — без него
+# апдейты мог бы подделать любой, кто знает адрес.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or 8080)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Несколько ботов в одном процессе: путь к JSON со списком ботов (см. tenants.py).
+# Если пусто — один бот из BOT_TOKEN/ADMIN_IDS/CONTACT_* выше.
+BOTS_CONFIG = os.getenv("BOTS_CONFIG", "")
+
+# Метрики Prometheus: отдельный HTTP-сервер, по умолчанию только локально.
+# METRICS_PORT=0 — не поднимать.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
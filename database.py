@@ -1,12 +1,148 @@
+import datetime
+import json
+import os
+import re
 import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import hll
+import tenants
 
 DB_PATH = "bot.db"
 
+# Настройки соединения: WAL позволяет читать во время записи админа,
+# synchronous=NORMAL в WAL-режиме безопасен и заметно быстрее FULL.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",     # ~16 МБ страничного кэша
+    "PRAGMA mmap_size=134217728",   # 128 МБ memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Кэш подготовленных выражений на соединение (sqlite3 переиспользует их по тексту SQL)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_all_conns: list[sqlite3.Connection] = []
+_all_lock = threading.Lock()
+_generation = 0  # растёт при close_all(), чтобы потоки не держали закрытые соединения
+
+COUNTED_TABLES = ("reviews", "services", "gifts")
+CONTENT_TABLES = ("greeting",) + COUNTED_TABLES
+
+# Колонки, которые отдаются наружу для каждого раздела
+COLUMNS = {
+    "reviews": "id, author, text, date",
+    "services": "id, name, description, file_path",
+    "gifts": "id, name, description, file_path",
+}
+
+# Полнотекстовый поиск: раздел -> (колонка-заголовок, колонка-текст)
+FTS_COLUMNS = {
+    "reviews": ("author", "text"),
+    "services": ("name", "description"),
+    "gifts": ("name", "description"),
+}
+# Вес совпадения в заголовке относительно текста (bm25)
+FTS_TITLE_WEIGHT = 10.0
+
+# Подписчики на изменение контента (каталог в памяти, кэши клавиатур и т.п.)
+_change_listeners = []
+
+
+# ---------- CONNECTIONS ----------
+def get_conn() -> sqlite3.Connection:
+    """Долгоживущее соединение текущего потока (по одному на поток и файл БД).
+
+    Файл — БД текущего бота (tenants.current()), по умолчанию DB_PATH.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    path = tenants.current().db_path or DB_PATH
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(
+            path, timeout=5,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,  # закрываем из главного потока в close_all()
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conns[path] = conn
+        with _all_lock:
+            _all_conns.append(conn)
+    return conn
+
+
+def close_all():
+    """Закрыть все открытые соединения (при остановке бота)."""
+    global _generation
+    with _all_lock:
+        _generation += 1
+        for conn in _all_conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _all_conns.clear()
+
+
+def _fetchone(sql: str, params=()):
+    return get_conn().execute(sql, params).fetchone()
+
+
+def _fetchall(sql: str, params=()):
+    return get_conn().execute(sql, params).fetchall()
+
+
+def _execute(sql: str, params=()):
+    conn = get_conn()
+    with conn:
+        conn.execute(sql, params)
+
+
+@contextmanager
+def write_transaction():
+    """Транзакция с немедленной блокировкой записи (BEGIN IMMEDIATE).
+
+    Нужна для read-modify-write, когда в ту же базу пишут несколько процессов.
+    """
+    conn = get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def on_change(callback):
+    """Зарегистрировать callback(), вызываемый после каждой записи контента."""
+    _change_listeners.append(callback)
+    return callback
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
+def _notify():
+    for callback in _change_listeners:
+        callback()
+
+
+# ---------- MIGRATIONS ----------
+# Схема версионируется через PRAGMA user_version: версия N означает, что
+# применены первые N миграций из MIGRATIONS. Каждая миграция — отдельная
+# транзакция вместе с новым номером версии; список только дописывается.
+
+def _base_schema(cursor: sqlite3.Cursor):
+    """1: исходная схема. IF NOT EXISTS — чтобы принять базы, созданные до миграций."""
     # Приветствие
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS greeting (
@@ -49,181 +185,750 @@ def init_db():
         )
     """)
 
-    conn.commit()
-    conn.close()
+    # Реестр file_id: локальный файл (путь + хэш содержимого) -> id в Telegram
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS file_ids (
+            path TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (path, content_hash, kind)
+        )
+    """)
+
+    # Индексы под keyset-пагинацию: ORDER BY created_at DESC, id DESC
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_services_created ON services (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_gifts_created ON gifts (created_at, id)")
+
+    # Счётчики контента: поддерживаются триггерами, COUNT(*) не нужен
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in COUNTED_TABLES:
+        # Засеваем один раз реальным количеством (для уже существующей базы)
+        cursor.execute(
+            f"INSERT OR IGNORE INTO counters (name, value) SELECT ?, COUNT(*) FROM {table}",
+            (table,)
+        )
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_ins AFTER INSERT ON {table}
+            BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = '{table}';
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_del AFTER DELETE ON {table}
+            BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = '{table}';
+            END
+        """)
+
+    # Версия контента: растёт при любой правке, по ней другие процессы
+    # узнают, что пора перечитать каталог (см. catalog.refresh_if_stale)
+    cursor.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('content_version', 0)")
+    for table in CONTENT_TABLES:
+        for event in ("INSERT", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE counters SET value = value + 1 WHERE name = 'content_version';
+                END
+            """)
+
+    # FSM-состояния пользователей (общие для всех процессов бота)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fsm (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+
+    # Все, кто нажимал /start (для рассылок)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            blocked INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Рассылки: cursor — последний обработанный user_id, по нему продолжаем после падения.
+    # lease_until — до какого момента рассылку ведёт процесс, который её захватил.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            report_chat_id INTEGER NOT NULL,
+            report_message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            lease_until INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            finished_at INTEGER
+        )
+    """)
+
+    # Полнотекстовые индексы (FTS5, external content): хранят только токены,
+    # сами строки читаются из основной таблицы. Синхронизируются триггерами.
+    for table, (title, body) in FTS_COLUMNS.items():
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table}_fts",)
+        ).fetchone()
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                {title}, {body},
+                content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        if not exists:
+            # Индекс появился у базы с данными — проиндексировать их один раз
+            cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_ins AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_fts (rowid, {title}, {body}) VALUES (new.id, new.{title}, new.{body});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_del AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {title}, {body})
+                VALUES ('delete', old.id, old.{title}, old.{body});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_upd AFTER UPDATE OF {title}, {body} ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {title}, {body})
+                VALUES ('delete', old.id, old.{title}, old.{body});
+                INSERT INTO {table}_fts (rowid, {title}, {body}) VALUES (new.id, new.{title}, new.{body});
+            END
+        """)
+
+    # Журнал действий пользователей и суточные сводки по нему (см. events.py).
+    # events — сырой поток, daily_* — то, что читает экран «Анализ».
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,  -- id не переиспользуются: на них держится курсор свёртки
+            ts INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_id INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_events (
+            day TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, kind)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_users (
+            day TEXT PRIMARY KEY,
+            hll BLOB NOT NULL
+        )
+    """)
+    # До какого events.id сводки уже посчитаны
+    cursor.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('events_rolled', 0)")
+
+
+def _created_ts(cursor: sqlite3.Cursor):
+    """2: целочисленный ключ сортировки created_ts (epoch) и индексы под списки."""
+    for table in COUNTED_TABLES:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN created_ts INTEGER NOT NULL DEFAULT 0")
+        cursor.execute(f"UPDATE {table} SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)")
+        # Порядок списков и keyset-пагинации: ORDER BY created_ts DESC, id DESC
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_created")
+        cursor.execute(f"CREATE INDEX idx_{table}_created_ts ON {table} (created_ts, id)")
+    # Получатели рассылки (users_after, подсчёт total) — только из индекса
+    cursor.execute("CREATE INDEX idx_users_active ON users (user_id) WHERE blocked = 0")
+
+
+def _broadcast_owner(cursor: sqlite3.Cursor):
+    """3: владелец аренды рассылки — продлевать её и двигать курсор может только он."""
+    cursor.execute("ALTER TABLE broadcasts ADD COLUMN lease_owner TEXT NOT NULL DEFAULT ''")
+
+
+MIGRATIONS = (
+    _base_schema,
+    _created_ts,
+    _broadcast_owner,
+)
+
+
+def schema_version() -> int:
+    return _fetchone("PRAGMA user_version")[0]
+
+
+def init_db():
+    """Довести схему текущей базы до последней версии. Если она уже актуальна — один PRAGMA."""
+    if schema_version() >= len(MIGRATIONS):
+        return
+    for version, migration in enumerate(MIGRATIONS, 1):
+        with write_transaction() as conn:
+            # Перечитываем под блокировкой: параллельный процесс мог уже мигрировать
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+
+
+# ---------- COUNTERS ----------
+def _count(name: str) -> int:
+    row = _fetchone("SELECT value FROM counters WHERE name = ?", (name,))
+    return row[0] if row else 0
+
+
+def get_counters() -> dict[str, int]:
+    """Все счётчики одним запросом: {'reviews': .., 'services': .., 'gifts': ..}."""
+    counts = dict.fromkeys(COUNTED_TABLES, 0)
+    counts.update(_fetchall("SELECT name, value FROM counters"))
+    return counts
+
+
+def content_version() -> int:
+    return _count("content_version")
+
+
+# ---------- KEYSET PAGINATION ----------
+# Курсор — позиция в порядке (created_ts DESC, id DESC): "<op><epoch>_<id>", где op:
+#   n — строки после ключа (следующая страница),
+#   p — строки перед ключом (предыдущая страница),
+#   f — страница, начинающаяся с ключа (возврат к той же странице).
+Page = namedtuple("Page", "items page prev_cursor next_cursor anchor total")
+
+_SEEK = {
+    None: "",
+    "n": "WHERE (created_ts, id) < (?, ?)",
+    "f": "WHERE (created_ts, id) <= (?, ?)",
+    "p": "WHERE (created_ts, id) > (?, ?)",
+}
+
+
+def make_cursor(op: str, ts: int, row_id: int) -> str:
+    return f"{op}{ts}_{row_id}"
+
+
+def parse_cursor(cursor: str | None):
+    """Вернёт (op, epoch, id) или None для пустого/битого курсора."""
+    if not cursor or cursor[0] not in "nfp":
+        return None
+    try:
+        ts, row_id = cursor[1:].split("_")
+        return cursor[0], int(ts), int(row_id)
+    except ValueError:
+        return None
+
+
+def _seek_page(table: str, page: int, cursor: str | None, limit: int) -> Page:
+    select = f"SELECT {COLUMNS[table]}, created_ts FROM {table}"
+    parsed = parse_cursor(cursor)
+
+    if parsed is None and page > 0:
+        # Старые кнопки без курсора: честный OFFSET как раньше
+        rows = _fetchall(
+            f"{select} ORDER BY created_ts DESC, id DESC LIMIT ? OFFSET ?",
+            (limit + 1, page * limit)
+        )
+        backward = False
+    elif parsed is None:
+        rows = _fetchall(f"{select} ORDER BY created_ts DESC, id DESC LIMIT ?", (limit + 1,))
+        backward = False
+    else:
+        op, ts, row_id = parsed
+        backward = op == "p"
+        order = "ASC" if backward else "DESC"
+        rows = _fetchall(
+            f"{select} {_SEEK[op]} ORDER BY created_ts {order}, id {order} LIMIT ?",
+            (ts, row_id, limit + 1)
+        )
+
+    if backward:
+        has_before = len(rows) > limit
+        rows = rows[:limit][::-1]
+        if not has_before:
+            page = 0
+            if len(rows) < limit:
+                # Дошли до начала, а страница неполная — перечитываем первую целиком
+                return _seek_page(table, 0, None, limit)
+        # Есть ли что-то после страницы — одна точечная проверка по индексу
+        has_after = bool(rows) and _fetchone(
+            f"SELECT 1 FROM {table} {_SEEK['n']} LIMIT 1",
+            (rows[-1][-1], rows[-1][0])
+        ) is not None
+    else:
+        has_after = len(rows) > limit
+        rows = rows[:limit]
+        has_before = page > 0
+
+    total = _count(table)
+    if not rows:
+        return Page([], page, None, None, None, total)
+
+    first, last = rows[0], rows[-1]
+    return Page(
+        items=[row[:-1] for row in rows],
+        page=page,
+        prev_cursor=make_cursor("p", first[-1], first[0]) if has_before else None,
+        next_cursor=make_cursor("n", last[-1], last[0]) if has_after else None,
+        anchor=make_cursor("f", first[-1], first[0]),
+        total=total,
+    )
+
+
+# ---------- SNAPSHOT ----------
+def snapshot_rows(table: str):
+    """Все строки раздела в порядке показа, последним полем — created_ts."""
+    return _fetchall(f"""
+        SELECT {COLUMNS[table]}, created_ts
+        FROM {table}
+        ORDER BY created_ts DESC, id DESC
+    """)
 
 
 # ---------- GREETING ----------
 def save_greeting(photo_path: str, text: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM greeting")
-    cursor.execute("INSERT INTO greeting (photo_path, text) VALUES (?, ?)", (photo_path, text))
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with conn:
+        conn.execute("DELETE FROM greeting")
+        conn.execute("INSERT INTO greeting (photo_path, text) VALUES (?, ?)", (photo_path, text))
+    _notify()
 
 
 def get_greeting():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT photo_path, text FROM greeting LIMIT 1")
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    return _fetchone("SELECT photo_path, text FROM greeting LIMIT 1")
 
 
 # ---------- REVIEWS ----------
 def add_review(author: str, text: str, date_str: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO reviews (author, text, date) VALUES (?, ?, ?)",
-        (author, text, date_str)
+    _execute(
+        "INSERT INTO reviews (author, text, date, created_ts) VALUES (?, ?, ?, ?)",
+        (author, text, date_str, int(time.time()))
     )
-    conn.commit()
-    conn.close()
+    _notify()
 
 
 def list_reviews(offset: int = 0, limit: int = 5):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return _fetchall("""
         SELECT id, author, text, date
         FROM reviews
-        ORDER BY created_at DESC, id DESC
+        ORDER BY created_ts DESC, id DESC
         LIMIT ? OFFSET ?
     """, (limit, offset))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+
+
+def page_reviews(page: int = 0, cursor: str | None = None, limit: int = 5) -> Page:
+    return _seek_page("reviews", page, cursor, limit)
 
 
 def count_reviews():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM reviews")
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+    return _count("reviews")
 
 
 def get_review_by_id(review_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, author, text, date FROM reviews WHERE id = ?", (review_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT id, author, text, date FROM reviews WHERE id = ?", (review_id,))
 
 
 def delete_review(review_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
-    conn.commit()
-    conn.close()
+    _execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+    _notify()
 
 
 # ---------- SERVICES ----------
 def add_service(name: str, description: str, file_path: str | None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO services (name, description, file_path) VALUES (?, ?, ?)",
-        (name, description, file_path)
+    _execute(
+        "INSERT INTO services (name, description, file_path, created_ts) VALUES (?, ?, ?, ?)",
+        (name, description, file_path, int(time.time()))
     )
-    conn.commit()
-    conn.close()
+    _notify()
 
 
 def list_services(offset: int = 0, limit: int = 5):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return _fetchall("""
         SELECT id, name, description, file_path
         FROM services
-        ORDER BY created_at DESC, id DESC
+        ORDER BY created_ts DESC, id DESC
         LIMIT ? OFFSET ?
     """, (limit, offset))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+
+
+def page_services(page: int = 0, cursor: str | None = None, limit: int = 5) -> Page:
+    return _seek_page("services", page, cursor, limit)
 
 
 def count_services():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM services")
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+    return _count("services")
 
 
 def get_service_by_id(service_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, description, file_path FROM services WHERE id = ?", (service_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT id, name, description, file_path FROM services WHERE id = ?", (service_id,))
 
 
 def delete_service(service_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM services WHERE id = ?", (service_id,))
-    conn.commit()
-    conn.close()
+    _execute("DELETE FROM services WHERE id = ?", (service_id,))
+    _notify()
 
 
 # ---------- GIFTS ----------
 def add_gift(name: str, description: str, file_path: str | None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO gifts (name, description, file_path) VALUES (?, ?, ?)",
-        (name, description, file_path)
+    _execute(
+        "INSERT INTO gifts (name, description, file_path, created_ts) VALUES (?, ?, ?, ?)",
+        (name, description, file_path, int(time.time()))
     )
-    conn.commit()
-    conn.close()
+    _notify()
 
 
 def list_gifts(offset: int = 0, limit: int = 5):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return _fetchall("""
         SELECT id, name, description, file_path
         FROM gifts
-        ORDER BY created_at DESC, id DESC
+        ORDER BY created_ts DESC, id DESC
         LIMIT ? OFFSET ?
     """, (limit, offset))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+
+
+def page_gifts(page: int = 0, cursor: str | None = None, limit: int = 5) -> Page:
+    return _seek_page("gifts", page, cursor, limit)
 
 
 def count_gifts():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM gifts")
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+    return _count("gifts")
 
 
 def get_gift_by_id(gift_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, description, file_path FROM gifts WHERE id = ?", (gift_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT id, name, description, file_path FROM gifts WHERE id = ?", (gift_id,))
 
 
 def delete_gift(gift_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM gifts WHERE id = ?", (gift_id,))
-    conn.commit()
-    conn.close()
-    
\ No newline at end of file
+    _execute("DELETE FROM gifts WHERE id = ?", (gift_id,))
+    _notify()
+
+
+# ---------- SEARCH ----------
+def fts_query(text: str) -> str | None:
+    """Пользовательский ввод -> безопасный запрос FTS5: каждое слово как префикс, все слова обязательны."""
+    words = re.findall(r"\w+", text.lower())[:8]
+    return " ".join(f'"{w}"*' for w in words) or None
+
+
+def search(text: str, limit: int = 10) -> list[tuple[str, int, str]]:
+    """Поиск сразу по всем разделам одним запросом: [(раздел, id, заголовок)] по релевантности."""
+    query = fts_query(text)
+    if query is None:
+        return []
+    parts = [
+        f"SELECT '{table}', rowid, {title}, bm25({table}_fts, {FTS_TITLE_WEIGHT}, 1.0) AS rank "
+        f"FROM {table}_fts WHERE {table}_fts MATCH ?"
+        for table, (title, _body) in FTS_COLUMNS.items()
+    ]
+    sql = " UNION ALL ".join(parts) + " ORDER BY rank LIMIT ?"
+    return [tuple(r[:3]) for r in _fetchall(sql, (query,) * len(parts) + (limit,))]
+
+
+# ---------- FILE IDS ----------
+def get_file_id(path: str, content_hash: str, kind: str):
+    row = _fetchone(
+        "SELECT file_id FROM file_ids WHERE path = ? AND content_hash = ? AND kind = ?",
+        (path, content_hash, kind)
+    )
+    return row[0] if row else None
+
+
+def save_file_id(path: str, content_hash: str, kind: str, file_id: str):
+    _execute(
+        "INSERT OR REPLACE INTO file_ids (path, content_hash, kind, file_id) VALUES (?, ?, ?, ?)",
+        (path, content_hash, kind, file_id)
+    )
+
+
+def forget_file_id(path: str, content_hash: str, kind: str):
+    _execute(
+        "DELETE FROM file_ids WHERE path = ? AND content_hash = ? AND kind = ?",
+        (path, content_hash, kind)
+    )
+
+
+def forget_file_ids_for(paths):
+    """Удалить закэшированные file_id для удалённых с диска файлов."""
+    conn = get_conn()
+    with conn:
+        conn.executemany("DELETE FROM file_ids WHERE path = ?", [(p,) for p in paths])
+
+
+# ---------- MEDIA ----------
+def referenced_media() -> set[str]:
+    """Все пути к файлам, на которые ссылается контент."""
+    rows = _fetchall("""
+        SELECT photo_path FROM greeting WHERE photo_path IS NOT NULL
+        UNION SELECT file_path FROM services WHERE file_path IS NOT NULL
+        UNION SELECT file_path FROM gifts WHERE file_path IS NOT NULL
+    """)
+    return {os.path.normpath(r[0]) for r in rows}
+
+# ---------- FSM ----------
+def fsm_get(key: str):
+    """(state, data, version) или None, если записи нет."""
+    row = _fetchone("SELECT state, data, version FROM fsm WHERE key = ?", (key,))
+    if row is None:
+        return None
+    return row[0], json.loads(row[1]), row[2]
+
+
+def fsm_set_state(key: str, state: str | None):
+    _execute("""
+        INSERT INTO fsm (key, state, version, updated_at) VALUES (?, ?, 1, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            state = excluded.state, version = version + 1, updated_at = excluded.updated_at
+    """, (key, state, int(time.time())))
+
+
+def fsm_set_data(key: str, data: dict):
+    conn = get_conn()
+    with conn:
+        conn.execute("""
+            INSERT INTO fsm (key, data, version, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                data = excluded.data, version = version + 1, updated_at = excluded.updated_at
+        """, (key, json.dumps(data, ensure_ascii=False), int(time.time())))
+        if not data:
+            # state.clear(): ни состояния, ни данных — строка больше не нужна
+            conn.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL", (key,))
+
+
+def fsm_update_data(key: str, patch: dict) -> dict:
+    """Атомарно слить patch с текущими данными (безопасно для нескольких процессов)."""
+    with write_transaction() as conn:
+        row = conn.execute("SELECT data FROM fsm WHERE key = ?", (key,)).fetchone()
+        data = json.loads(row[0]) if row else {}
+        data.update(patch)
+        conn.execute("""
+            INSERT INTO fsm (key, data, version, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                data = excluded.data, version = version + 1, updated_at = excluded.updated_at
+        """, (key, json.dumps(data, ensure_ascii=False), int(time.time())))
+    return data
+
+
+def fsm_apply(key: str, set_state: bool, state: str | None, data: dict | None, patch: dict | None):
+    """Записать итог одного апдейта одной транзакцией.
+
+    set_state — менять ли состояние; data — новые данные целиком (None —
+    оставить текущие); patch — ключи, которые слить поверх.
+    """
+    with write_transaction() as conn:
+        row = conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        cur_state, cur_data = (row[0], json.loads(row[1])) if row else (None, {})
+        new_state = state if set_state else cur_state
+        new_data = dict(cur_data if data is None else data)
+        if patch:
+            new_data.update(patch)
+        if new_state is None and not new_data:
+            conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            return
+        conn.execute("""
+            INSERT INTO fsm (key, state, data, version, updated_at) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state, data = excluded.data,
+                version = version + 1, updated_at = excluded.updated_at
+        """, (key, new_state, json.dumps(new_data, ensure_ascii=False), int(time.time())))
+
+
+# ---------- USERS ----------
+def upsert_users(seen: dict[int, int]):
+    """Пачка {user_id: время последнего /start}. Повторный /start снимает пометку blocked."""
+    with write_transaction() as conn:
+        conn.executemany("""
+            INSERT INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                last_seen = MAX(last_seen, excluded.last_seen), blocked = 0
+        """, [(user_id, ts, ts) for user_id, ts in seen.items()])
+
+
+def users_after(user_id: int, limit: int) -> list[int]:
+    """Следующая пачка получателей рассылки в порядке user_id (keyset по первичному ключу)."""
+    rows = _fetchall(
+        "SELECT user_id FROM users WHERE user_id > ? AND blocked = 0 ORDER BY user_id LIMIT ?",
+        (user_id, limit),
+    )
+    return [r[0] for r in rows]
+
+
+# ---------- BROADCASTS ----------
+BROADCAST_COLUMNS = (
+    "id, from_chat_id, message_id, report_chat_id, report_message_id, "
+    "status, cursor, total, sent, failed, blocked"
+)
+Broadcast = namedtuple("Broadcast", BROADCAST_COLUMNS.replace(",", ""))
+
+
+def create_broadcast(from_chat_id: int, message_id: int, report_chat_id: int) -> int:
+    with write_transaction() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM users WHERE blocked = 0").fetchone()[0]
+        cur = conn.execute("""
+            INSERT INTO broadcasts (from_chat_id, message_id, report_chat_id, total, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (from_chat_id, message_id, report_chat_id, total, int(time.time())))
+        return cur.lastrowid
+
+
+def get_broadcast(broadcast_id: int) -> Broadcast | None:
+    row = _fetchone(f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE id = ?", (broadcast_id,))
+    return Broadcast(*row) if row else None
+
+
+def running_broadcasts() -> list[int]:
+    return [r[0] for r in _fetchall("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")]
+
+
+def claim_broadcast(broadcast_id: int, owner: str, lease: int) -> bool:
+    """Захватить рассылку, если её никто не ведёт (аренда истекла). Атомарно между процессами."""
+    now = int(time.time())
+    conn = get_conn()
+    with conn:
+        cur = conn.execute("""
+            UPDATE broadcasts SET lease_until = ?, lease_owner = ?
+            WHERE id = ? AND status = 'running' AND lease_until < ?
+        """, (now + lease, owner, broadcast_id, now))
+    return cur.rowcount == 1
+
+
+def renew_broadcast(broadcast_id: int, owner: str, lease: int) -> bool:
+    """Продлить аренду. False — рассылку остановили или её ведёт уже другой процесс."""
+    conn = get_conn()
+    with conn:
+        cur = conn.execute("""
+            UPDATE broadcasts SET lease_until = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        """, (int(time.time()) + lease, broadcast_id, owner))
+    return cur.rowcount == 1
+
+
+def set_broadcast_report(broadcast_id: int, report_message_id: int):
+    _execute("UPDATE broadcasts SET report_message_id = ? WHERE id = ?", (report_message_id, broadcast_id))
+
+
+def broadcast_progress(broadcast_id: int, owner: str, cursor: int, sent: int, failed: int,
+                       blocked_ids: list[int], lease: int) -> str | None:
+    """Зафиксировать обработанную пачку и продлить аренду.
+
+    Вернёт текущий статус или None, если аренда уже у другого процесса
+    (тогда ничего не записывается).
+    """
+    with write_transaction() as conn:
+        cur = conn.execute("""
+            UPDATE broadcasts SET cursor = ?, sent = sent + ?, failed = failed + ?,
+                blocked = blocked + ?, lease_until = ?
+            WHERE id = ? AND lease_owner = ?
+        """, (cursor, sent, failed, len(blocked_ids), int(time.time()) + lease, broadcast_id, owner))
+        if cur.rowcount == 0:
+            return None
+        if blocked_ids:
+            conn.executemany("UPDATE users SET blocked = 1 WHERE user_id = ?", [(u,) for u in blocked_ids])
+        return conn.execute("SELECT status FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()[0]
+
+
+def finish_broadcast(broadcast_id: int, status: str, owner: str | None = None):
+    """Завершить рассылку; с owner — только если аренда всё ещё у него (админская остановка — без owner)."""
+    sql = """
+        UPDATE broadcasts SET status = ?, finished_at = ?, lease_until = 0
+        WHERE id = ? AND status = 'running'
+    """
+    params = (status, int(time.time()), broadcast_id)
+    if owner:
+        sql += " AND lease_owner = ?"
+        params += (owner,)
+    _execute(sql, params)
+
+
+# ---------- EVENTS ----------
+EVENTS_RETENTION = 30 * 86400   # сколько хранить сырые события после свёртки, сек
+ROLLUP_CHUNK = 50000            # событий за одну транзакцию свёртки
+
+_DAY = "date(ts, 'unixepoch', 'localtime')"
+
+
+def log_events(rows):
+    """Пачка (ts, user_id, kind, item_id) одной транзакцией."""
+    with write_transaction() as conn:
+        conn.executemany("INSERT INTO events (ts, user_id, kind, item_id) VALUES (?, ?, ?, ?)", rows)
+
+
+def roll_up_events() -> int:
+    """Досчитать суточные сводки по новым событиям. Вернёт число обработанных событий.
+
+    Каждая порция — одна транзакция вместе со сдвигом курсора events_rolled,
+    так что событие попадает в сводку ровно один раз.
+    """
+    done = 0
+    while True:
+        with write_transaction() as conn:
+            start = conn.execute("SELECT value FROM counters WHERE name = 'events_rolled'").fetchone()[0]
+            end = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM events WHERE id > ? ORDER BY id LIMIT ?)",
+                (start, ROLLUP_CHUNK)
+            ).fetchone()[0]
+            if end is None:
+                return done
+
+            conn.execute(f"""
+                INSERT INTO daily_events (day, kind, count)
+                SELECT {_DAY}, kind, COUNT(*) FROM events WHERE id > ? AND id <= ? GROUP BY 1, 2
+                ON CONFLICT(day, kind) DO UPDATE SET count = count + excluded.count
+            """, (start, end))
+
+            seen: dict[str, list[int]] = {}
+            for day, user_id in conn.execute(
+                f"SELECT DISTINCT {_DAY}, user_id FROM events WHERE id > ? AND id <= ?", (start, end)
+            ):
+                seen.setdefault(day, []).append(user_id)
+            for day, user_ids in seen.items():
+                row = conn.execute("SELECT hll FROM daily_users WHERE day = ?", (day,)).fetchone()
+                registers = bytearray(row[0]) if row else hll.empty()
+                for user_id in user_ids:
+                    hll.add(registers, user_id)
+                conn.execute(
+                    "INSERT OR REPLACE INTO daily_users (day, hll) VALUES (?, ?)", (day, bytes(registers))
+                )
+
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'events_rolled'", (end,))
+            conn.execute(
+                "DELETE FROM events WHERE id <= ? AND ts < ?", (end, int(time.time()) - EVENTS_RETENTION)
+            )
+            done += end - start
+
+
+def analytics_summary() -> dict:
+    """Сводка для экрана «Анализ»: только из daily_events/daily_users."""
+    today = datetime.date.today()
+    since = {
+        "today": today.isoformat(),
+        "week": (today - datetime.timedelta(days=6)).isoformat(),
+        "month": (today - datetime.timedelta(days=29)).isoformat(),
+    }
+    summary = {"events": {}, "users": {}}
+    for period in ("today", "week"):
+        summary["events"][period] = dict(_fetchall(
+            "SELECT kind, SUM(count) FROM daily_events WHERE day >= ? GROUP BY kind", (since[period],)
+        ))
+    for period, day in since.items():
+        registers = hll.empty()
+        for (blob,) in _fetchall("SELECT hll FROM daily_users WHERE day >= ?", (day,)):
+            hll.merge(registers, blob)
+        summary["users"][period] = hll.estimate(registers)
+    return summary
@@ -0,0 +1,70 @@
+"""Журнал действий пользователей.
+
+record() только добавляет кортеж в буфер — это микросекунды на горячем пути.
+Буфер уходит в таблицу events пачкой (раз в FLUSH_INTERVAL секунд или по
+FLUSH_BATCH событий), а раз в ROLLUP_INTERVAL события сворачиваются в
+суточные сводки daily_events / daily_users, которые и читает «📊 Анализ».
+Буфер у каждого бота (tenants) свой и пишется в его БД.
+"""
+import asyncio
+import logging
+import time
+
+import async_db
+import tenants
+
+FLUSH_INTERVAL = 2.0
+FLUSH_BATCH = 1000
+ROLLUP_INTERVAL = 60.0
+
+# Виды событий и подписи для экрана аналитики
+KINDS = {
+    "start": "▶️ /start",
+    "open_reviews": "💬 Открыли отзывы",
+    "open_services": "🛠 Открыли услуги",
+    "open_gifts": "🎁 Открыли подарки",
+    "open_contacts": "📞 Открыли контакты",
+    "view_review": "👀 Просмотры отзывов",
+    "view_service": "👀 Просмотры услуг",
+    "view_gift": "👀 Просмотры подарков",
+    "search": "🔍 Поиски",
+}
+
+_buffers: dict[str, list[tuple]] = {}   # имя бота -> события
+_tasks: dict[str, asyncio.Task] = {}   # имя бота -> запущенный сброс
+
+
+def record(user_id: int, kind: str, item_id: int | None = None):
+    name = tenants.current().name
+    buffer = _buffers.setdefault(name, [])
+    buffer.append((int(time.time()), user_id, kind, item_id))
+    if len(buffer) >= FLUSH_BATCH and name not in _tasks:  # сброс этого бота уже запущен — не плодим задачи
+        task = _tasks[name] = asyncio.create_task(flush())
+        task.add_done_callback(lambda _: _tasks.pop(name, None))
+
+
+async def flush():
+    """Записать буфер текущего бота одной транзакцией."""
+    name = tenants.current().name
+    batch = _buffers.pop(name, None)
+    if not batch:
+        return
+    try:
+        await async_db.log_events(batch)
+    except Exception:
+        _buffers.setdefault(name, [])[:0] = batch  # вернуть в начало очереди, попробуем в следующий раз
+        raise
+
+
+async def run_forever(flush_interval: float = FLUSH_INTERVAL, rollup_interval: float = ROLLUP_INTERVAL):
+    """Фоновая задача бота (запускается в его контексте): сброс буфера и периодическая свёртка в сводки."""
+    rolled = time.monotonic()
+    while True:
+        await asyncio.sleep(flush_interval)
+        try:
+            await flush()
+            if time.monotonic() - rolled >= rollup_interval:
+                await async_db.roll_up_events()
+                rolled = time.monotonic()
+        except Exception:
+            logging.exception("event log flush failed")
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+import async_db
+import tenants
+
+# path -> (mtime_ns, size, sha256): хэш пересчитываем, только если файл изменился
+_hashes: dict[str, tuple[int, int, str]] = {}
+# (бот, path, hash, kind) -> file_id: горячая копия таблицы file_ids.
+# file_id действителен только для бота, который загрузил файл, — отсюда имя бота в ключе.
+_file_ids: dict[tuple[str, str, str, str], str] = {}
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def content_hash(path: str) -> str:
+    st = os.stat(path)
+    cached = _hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    digest = await asyncio.to_thread(_sha256, path)
+    _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def _extract_file_id(msg: Message, kind: str) -> str | None:
+    if kind == "photo" and msg.photo:
+        return msg.photo[-1].file_id
+    if kind == "document" and msg.document:
+        return msg.document.file_id
+    return None
+
+
+async def _send(send, kind: str, path: str, **kwargs) -> Message:
+    digest = await content_hash(path)
+    key = (tenants.current().name, path, digest, kind)
+
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        file_id = await async_db.get_file_id(path, digest, kind)
+    if file_id:
+        try:
+            msg = await send(file_id, **kwargs)
+            _file_ids[key] = file_id
+            return msg
+        except TelegramBadRequest:
+            # Telegram больше не принимает id — забываем и загружаем файл заново
+            _file_ids.pop(key, None)
+            await async_db.forget_file_id(path, digest, kind)
+
+    msg = await send(FSInputFile(path), **kwargs)
+    new_id = _extract_file_id(msg, kind)
+    if new_id:
+        _file_ids[key] = new_id
+        await async_db.save_file_id(path, digest, kind, new_id)
+    return msg
+
+
+async def cached_file_id(path: str, kind: str) -> str | None:
+    """file_id уже загруженного файла без отправки (для inline-результатов) или None."""
+    try:
+        digest = await content_hash(path)
+    except FileNotFoundError:
+        return None
+    key = (tenants.current().name, path, digest, kind)
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        file_id = await async_db.get_file_id(path, digest, kind)
+        if file_id:
+            _file_ids[key] = file_id
+    return file_id
+
+
+async def send_photo(send, path: str, **kwargs) -> Message:
+    """Отправить фото через send (например, message.answer_photo), по возможности по file_id."""
+    return await _send(send, "photo", path, **kwargs)
+
+
+async def send_document(send, path: str, **kwargs) -> Message:
+    """То же для документов (message.answer_document)."""
+    return await _send(send, "document", path, **kwargs)
@@ -0,0 +1,143 @@
+import copy
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+import async_db
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        key.business_connection_id, key.destiny,
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm (bot.db).
+
+    Переживает перезапуск и общее для нескольких процессов бота: WAL даёт
+    параллельное чтение, а update_data сливает данные в одной транзакции
+    BEGIN IMMEDIATE, так что одновременные правки не теряются. Каждая
+    запись увеличивает version строки.
+    """
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await async_db.fsm_set_state(_key(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await async_db.fsm_get(_key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await async_db.fsm_set_data(_key(key), data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await async_db.fsm_get(_key(key))
+        return row[1] if row else {}
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await async_db.fsm_update_data(_key(key), data)
+
+    async def apply(self, key: StorageKey, set_state: bool, state: Optional[str],
+                    data: Optional[Dict[str, Any]], patch: Optional[Dict[str, Any]]) -> None:
+        """Состояние и данные одной транзакцией (см. BufferedFSMContext.flush)."""
+        await async_db.fsm_apply(_key(key), set_state, state, data, patch)
+
+    async def close(self) -> None:
+        # Соединения закрывает async_db.shutdown()
+        pass
+
+
+# ---------- Буферизация FSM в пределах одного апдейта ----------
+
+class BufferedFSMContext(FSMContext):
+    """FSMContext, который читает хранилище один раз и пишет один раз.
+
+    Все set_state/update_data/clear копятся в памяти, flush() отправляет
+    итог одним вызовом storage.apply (или обычными методами, если у
+    хранилища его нет). update_data уходит в БД как слияние ключей, так
+    что параллельные правки из других процессов не затираются.
+    """
+
+    def __init__(self, context: FSMContext, raw_state: Optional[str]) -> None:
+        super().__init__(storage=context.storage, key=context.key)
+        self._state = raw_state
+        self._state_changed = False
+        self._data: Optional[Dict[str, Any]] = None   # None — ещё не читали
+        self._replaced = False                        # был set_data/clear
+        self._patch: Dict[str, Any] = {}
+
+    async def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = copy.deepcopy(data)
+        self._replaced = True
+        self._patch = {}
+
+    async def get_data(self) -> Dict[str, Any]:
+        return copy.deepcopy(await self._load())
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        kwargs = copy.deepcopy(kwargs)
+        current = await self._load()
+        current.update(kwargs)
+        if not self._replaced:
+            self._patch.update(kwargs)
+        return copy.deepcopy(current)
+
+    async def flush(self) -> None:
+        if not (self._state_changed or self._replaced or self._patch):
+            return
+        data = self._data if self._replaced else None
+        patch = None if self._replaced else self._patch
+        apply = getattr(self.storage, "apply", None)
+        if apply is not None:
+            await apply(self.key, self._state_changed, self._state, data, patch)
+        else:
+            if self._state_changed:
+                await self.storage.set_state(key=self.key, state=self._state)
+            if data is not None:
+                await self.storage.set_data(key=self.key, data=data)
+            elif patch:
+                await self.storage.update_data(key=self.key, data=patch)
+        self._state_changed = self._replaced = False
+        self._patch = {}
+
+
+class FSMBufferMiddleware(BaseMiddleware):
+    """Inner-middleware роутера: подменяет data["state"] на BufferedFSMContext
+    и сбрасывает изменения после хендлера (даже если он упал)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        context = data.get("state")
+        if context is None:
+            return await handler(event, data)
+        buffered = BufferedFSMContext(context, data.get("raw_state"))
+        data["state"] = buffered
+        try:
+            return await handler(event, data)
+        finally:
+            await buffered.flush()
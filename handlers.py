@@ -1,39 +1,63 @@
+import asyncio
+import html
 import os
-from uuid import uuid4
 
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.filters import CommandStart
 from aiogram.exceptions import TelegramBadRequest
-from config import ADMIN_IDS
-
-from config import CONTACT_URL, CONTACT_BUTTON_TEXT
 from keyboards import (
     get_user_keyboard, get_admin_keyboard,
     get_settings_keyboard, get_greeting_menu,
     get_reviews_menu, get_reviews_delete_keyboard,
-    get_services_menu, get_services_view_keyboard, get_services_delete_keyboard, get_skip_file_keyboard,
-    get_gifts_menu, get_gifts_view_keyboard, get_gifts_delete_keyboard,
-    get_user_reviews_keyboard, get_user_services_keyboard, get_user_gifts_keyboard,
-    get_contacts_keyboard
+    get_services_menu, get_services_delete_keyboard, get_skip_file_keyboard,
+    get_gifts_menu, get_gifts_delete_keyboard,
+    get_contacts_keyboard,
+    get_broadcast_confirm_keyboard, get_search_results_keyboard
 )
-from database import (
+import catalog
+import callbacks as cb
+import broadcast
+import events
+import images
+import inline
+import metrics
+import pages
+import tenants
+import users
+from pages import PAGE_SIZE
+from media import ingest, folder as media_folder, MediaTooLarge, GREETING_FOLDER, SERVICES_FOLDER, GIFTS_FOLDER
+from file_registry import send_photo, send_document
+from fsm_storage import FSMBufferMiddleware
+from async_db import (
     save_greeting, get_greeting,
-    add_review, list_reviews, count_reviews, delete_review, get_review_by_id,
-    add_service, list_services, count_services, delete_service, get_service_by_id,
-    add_gift, list_gifts, count_gifts, delete_gift, get_gift_by_id
+    get_counters, analytics_summary, search,
+    add_review, page_reviews, delete_review,
+    add_service, page_services, delete_service,
+    add_gift, page_gifts, delete_gift
 )
 
 router = Router()
-
-GREETING_FOLDER = "media/greetings"
-SERVICES_FOLDER = "media/services"
-GIFTS_FOLDER = "media/gifts"
-PAGE_SIZE = 5
-
-IMG_FOLDER = "media/img"
+metrics.instrument(router)  # первым: время хендлера включает сброс FSM
+# FSM: одно чтение и одна запись хранилища на апдейт
+router.message.middleware(FSMBufferMiddleware())
+router.callback_query.middleware(FSMBufferMiddleware())
+# Кнопки: callback_data разбирается один раз, хендлер ищется по коду операции
+buttons = cb.CallbackDispatcher(router)
+
+SEARCH_LIMIT = 10
+
+# Очистка сообщений мастеров: deleteMessages принимает до 100 id за раз,
+# запасной поштучный путь ограничен по параллельности.
+PURGE_BATCH = 100
+PURGE_CONCURRENCY = 5
+_cleanup_tasks: set[asyncio.Task] = set()
+
+# Картинки разделов: media/img в медиа-корне бота, иначе общие из media/img
+IMG_FOLDER = "img"
+SHARED_IMG_FOLDER = "media/img"
 BTN_IMG = {
     "reviews": "Otz.png",
     "gifts":   "Sur.png",
@@ -48,8 +72,11 @@ def _img_path(key: str) -> str | None:
     name = BTN_IMG.get(key)
     if not name:
         return None
-    path = os.path.join(IMG_FOLDER, name)
-    return path if os.path.exists(path) else None
+    for folder in (media_folder(IMG_FOLDER), SHARED_IMG_FOLDER):
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            return path
+    return None
 
 
 async def _remember(state: FSMContext, msg):
@@ -58,14 +85,62 @@ async def _remember(state: FSMContext, msg):
     cleanup.append((msg.chat.id, msg.message_id))
     await state.update_data(cleanup=cleanup)
 
+async def _delete_messages(bot: Bot, items: list):
+    """Удалить сообщения пачками deleteMessages (по чатам), при ошибке — поштучно."""
+    by_chat: dict[int, list[int]] = {}
+    for chat_id, mid in items:
+        ids = by_chat.setdefault(chat_id, [])
+        if mid not in ids:
+            ids.append(mid)
+
+    sem = asyncio.Semaphore(PURGE_CONCURRENCY)
+
+    async def delete_one(chat_id: int, mid: int):
+        async with sem:
+            try:
+                await bot.delete_message(chat_id, mid)
+            except Exception:
+                pass
+
+    for chat_id, ids in by_chat.items():
+        for i in range(0, len(ids), PURGE_BATCH):
+            chunk = ids[i:i + PURGE_BATCH]
+            try:
+                await bot.delete_messages(chat_id, chunk)
+            except Exception:
+                await asyncio.gather(*(delete_one(chat_id, mid) for mid in chunk))
+
 async def _purge(state: FSMContext, bot: Bot):
+    """Убрать сообщения мастера. Удаление идёт в фоне — ответ админу его не ждёт."""
     data = await state.get_data()
-    for chat_id, mid in data.get("cleanup", []):
-        try:
-            await bot.delete_message(chat_id, mid)
-        except Exception:
-            pass
+    items = data.get("cleanup", [])
     await state.update_data(cleanup=[])
+    if items:
+        task = asyncio.create_task(_delete_messages(bot, items))
+        _cleanup_tasks.add(task)
+        task.add_done_callback(_cleanup_tasks.discard)
+
+async def _ingest_attachment(message: Message, bot: Bot, folder: str) -> str | None:
+    """Сохранить фото/документ из сообщения в folder; вернёт путь или None."""
+    if message.photo:
+        photo = message.photo[-1]
+        return await ingest(bot, photo.file_id, folder, ".jpg", "photo", photo.file_size)
+    if message.document:
+        doc = message.document
+        ext = os.path.splitext(doc.file_name or "")[1] or ".bin"
+        return await ingest(bot, doc.file_id, folder, ext if len(ext) <= 10 else ".bin", "document", doc.file_size)
+    return None
+
+
+async def _too_large(message: Message, state: FSMContext, err: MediaTooLarge):
+    await _remember(state, message)
+    prompt = await message.answer(
+        f"⚠️ Файл слишком большой — максимум <b>{err.limit // (1024 * 1024)} МБ</b>. "
+        "Пришлите поменьше.",
+        parse_mode="HTML"
+    )
+    await _remember(state, prompt)
+
 
 def _is_image(filepath: str) -> bool:
     ext = os.path.splitext(filepath.lower())[1]
@@ -93,14 +168,24 @@ class GiftFSM(StatesGroup):
     waiting_desc = State()
     waiting_file = State()
 
+class BroadcastFSM(StatesGroup):
+    waiting_message = State()
+    confirm = State()
+
+class SearchFSM(StatesGroup):
+    waiting_query = State()
+
 
 # =====================================================================
 #                              /start
 # =====================================================================
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
-    if message.from_user.id in ADMIN_IDS:
+async def cmd_start(message: Message, state: FSMContext, raw_state: str | None):
+    await _leave_search(state, raw_state)
+    users.touch(message.from_user.id)
+    events.record(message.from_user.id, "start")
+    if message.from_user.id in tenants.current().admin_ids:
         text = (
             "👋 <b>Привет, админ!</b>\n\n"
             "Добро пожаловать в панель управления.\n\n"
@@ -111,10 +196,10 @@ async def cmd_start(message: Message):
         await message.answer(text, reply_markup=get_admin_keyboard(), parse_mode="HTML")
         return
 
-    greeting = get_greeting()
+    greeting = catalog.current().greeting
     if greeting and greeting[0] and os.path.exists(greeting[0]):
-        await message.answer_photo(
-            FSInputFile(greeting[0]),
+        await send_photo(
+            message.answer_photo, images.best_variant(greeting[0]),
             caption=greeting[1],
             reply_markup=get_user_keyboard()
         )
@@ -125,7 +210,8 @@ async def cmd_start(message: Message):
             "• <b>💬 Отзывы</b> — почитайте, что говорят о нас реальные люди.\n"
             "• <b>🎁 Подарок</b> — специальные предложения и приятные сюрпризы.\n"
             "• <b>🛠 Услуги</b> — полный список того, чем мы можем помочь.\n"
-            "• <b>📞 Контакты</b> — быстро свяжитесь с нами в один клик.\n\n"
+            "• <b>📞 Контакты</b> — быстро свяжитесь с нами в один клик.\n"
+            "• <b>🔍 Поиск</b> — нажмите и напишите, что ищете.\n\n"
             "Выбирайте раздел ниже и поехали! 🚀"
         )
         await message.answer(text, reply_markup=get_user_keyboard(), parse_mode="HTML")
@@ -138,16 +224,26 @@ async def cmd_start(message: Message):
 # ---------- Анализ ----------
 @router.message(F.text == "📊 Анализ")
 async def admin_analytics(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in tenants.current().admin_ids:
         return
-    total_reviews = count_reviews()
-    total_services = count_services()
-    total_gifts = count_gifts()
+    counts = await get_counters()
+    summary = await analytics_summary()
+    today, week = summary["events"]["today"], summary["events"]["week"]
+    uniq = summary["users"]
+    activity = "\n".join(
+        f"{label}: <b>{today.get(kind, 0)}</b> / {week.get(kind, 0)}"
+        for kind, label in events.KINDS.items()
+    )
     text = (
         "📈 <b>Аналитика проекта</b>\n\n"
-        f"💬 Отзывов: <b>{total_reviews}</b>\n"
-        f"🛠 Услуг: <b>{total_services}</b>\n"
-        f"🎁 Подарков: <b>{total_gifts}</b>\n\n"
+        f"💬 Отзывов: <b>{counts['reviews']}</b>\n"
+        f"🛠 Услуг: <b>{counts['services']}</b>\n"
+        f"🎁 Подарков: <b>{counts['gifts']}</b>\n\n"
+        "👥 <b>Пользователи</b> (≈ уникальные)\n"
+        f"Сегодня: <b>{uniq['today']}</b> · 7 дней: <b>{uniq['week']}</b> · 30 дней: <b>{uniq['month']}</b>\n\n"
+        "📊 <b>Действия</b> (сегодня / 7 дней)\n"
+        f"{activity}\n\n"
+        "<i>Данные обновляются раз в минуту.</i>\n\n"
         "Поддерживайте актуальность контента — это прямой путь к доверию и продажам.🔥"
     )
     await message.answer(text, parse_mode="HTML")
@@ -156,18 +252,19 @@ async def admin_analytics(message: Message):
 # ---------- Настройки ----------
 @router.message(F.text == "⚙️ Настройки")
 async def settings_menu(message: Message):
-    if message.from_user.id in ADMIN_IDS:
+    if message.from_user.id in tenants.current().admin_ids:
         text = (
             "🛠 <b>Настройки</b>\n\n"
             "Что будем менять?\n"
             "• Приветствие — первое впечатление решает всё.\n"
             "• Отзывы — социальное доказательство.\n"
             "• Услуги — ваша экспертиза.\n"
-            "• Подарки — «вау»-эффект и любовь клиентов. 💝"
+            "• Подарки — «вау»-эффект и любовь клиентов. 💝\n"
+            "• Рассылка — новость сразу всем пользователям. 📣"
         )
         await message.answer(text, reply_markup=get_settings_keyboard(), parse_mode="HTML")
 
-@router.callback_query(F.data == "back_to_settings")
+@buttons.on(cb.SETTINGS)
 async def back_to_settings(callback: CallbackQuery):
     text = (
         "🛠 <b>Настройки</b>\n\n"
@@ -177,7 +274,7 @@ async def back_to_settings(callback: CallbackQuery):
 
 
 # ---------- Приветствие ----------
-@router.callback_query(F.data == "greeting_menu")
+@buttons.on(cb.GREETING_MENU)
 async def greeting_menu(callback: CallbackQuery):
     text = (
         "🔧 <b>Редактирование приветствия</b>\n\n"
@@ -185,17 +282,17 @@ async def greeting_menu(callback: CallbackQuery):
     )
     await callback.message.edit_text(text, reply_markup=get_greeting_menu(), parse_mode="HTML")
 
-@router.callback_query(F.data == "view_greeting")
+@buttons.on(cb.GREETING_VIEW)
 async def view_greeting(callback: CallbackQuery):
-    greeting = get_greeting()
+    greeting = await get_greeting()
     if greeting and greeting[0] and os.path.exists(greeting[0]):
-        await callback.message.answer_photo(FSInputFile(greeting[0]), caption=greeting[1])
+        await send_photo(callback.message.answer_photo, greeting[0], caption=greeting[1])
     else:
         await callback.message.answer("❗ Приветствие ещё не настроено. Загрузите фото и текст.")
 
-@router.callback_query(F.data == "edit_greeting")
+@buttons.on(cb.GREETING_EDIT)
 async def edit_greeting(callback: CallbackQuery, state: FSMContext):
-    os.makedirs(GREETING_FOLDER, exist_ok=True)
+    os.makedirs(media_folder(GREETING_FOLDER), exist_ok=True)
     prompt = await callback.message.answer(
         "📷 Отправьте <b>новое фото</b> для приветствия.\n\n"
         "Совет: светлая картинка без мелкого текста работает лучше. ✨",
@@ -206,10 +303,12 @@ async def edit_greeting(callback: CallbackQuery, state: FSMContext):
 
 @router.message(GreetingFSM.waiting_for_photo, F.photo)
 async def receive_photo(message: Message, state: FSMContext, bot: Bot):
-    tg_file = await bot.get_file(message.photo[-1].file_id)
-    filename = f"{uuid4()}.jpg"
-    path = os.path.join(GREETING_FOLDER, filename)
-    await bot.download_file(tg_file.file_path, path)
+    try:
+        path = await _ingest_attachment(message, bot, media_folder(GREETING_FOLDER))
+    except MediaTooLarge as err:
+        await _too_large(message, state, err)
+        return
+    images.schedule(path)
 
     await state.update_data(photo_path=path)
     await _remember(state, message)
@@ -226,7 +325,7 @@ async def receive_photo(message: Message, state: FSMContext, bot: Bot):
 async def receive_text(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     await _remember(state, message)
-    save_greeting(data["photo_path"], message.text)
+    await save_greeting(data["photo_path"], message.text)
 
     await _purge(state, bot)
     await state.clear()
@@ -234,7 +333,7 @@ async def receive_text(message: Message, state: FSMContext, bot: Bot):
 
 
 # ---------- Отзывы (админ) ----------
-@router.callback_query(F.data == "edit_reviews")
+@buttons.on(cb.REVIEWS_MENU)
 async def reviews_root(callback: CallbackQuery):
     text = (
         "🗂 <b>Управление отзывами</b>\n\n"
@@ -243,11 +342,7 @@ async def reviews_root(callback: CallbackQuery):
     )
     await callback.message.edit_text(text, reply_markup=get_reviews_menu(), parse_mode="HTML")
 
-@router.callback_query(F.data == "greeting_reviews_back")
-async def reviews_back(callback: CallbackQuery):
-    await reviews_root(callback)  # тот же текст
-
-@router.callback_query(F.data == "reviews_add")
+@buttons.on(cb.REVIEWS_ADD)
 async def reviews_add_start(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     prompt = await callback.message.answer(
@@ -277,41 +372,40 @@ async def reviews_add_text(message: Message, state: FSMContext):
 async def reviews_add_date(message: Message, state: FSMContext, bot: Bot):
     d = await state.get_data()
     await _remember(state, message)
-    add_review(d["author"], d["text"], message.text.strip())
+    await add_review(d["author"], d["text"], message.text.strip())
     await _purge(state, bot)
     await state.clear()
     await message.answer("✅ Отзыв добавлен! Спасибо, это усиливает наш бренд. 💪")
 
-@router.callback_query(F.data.startswith("reviews_delete_page:"))
-async def reviews_delete_page(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1]) if ":" in callback.data else 0
-    total = count_reviews()
-    items = list_reviews(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    if not items:
+@buttons.on(cb.REVIEWS_DELETE_PAGE)
+async def reviews_delete_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    p = await page_reviews(page, cursor, PAGE_SIZE)
+    if not p.items:
         await callback.message.edit_text("Пока отзывов нет. Добавьте первый — и начнётся магия! ✨", reply_markup=get_reviews_menu())
         return
-    text = f"🗑 <b>Удаление отзывов</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите отзыв:"
-    await callback.message.edit_text(text, reply_markup=get_reviews_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
-
-@router.callback_query(F.data.startswith("reviews_delete_id:"))
-async def reviews_delete_id(callback: CallbackQuery):
-    _, rid, page = callback.data.split(":")
-    rid, page = int(rid), int(page)
-    delete_review(rid)
+    text = f"🗑 <b>Удаление отзывов</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите отзыв:"
+    await callback.message.edit_text(text, reply_markup=get_reviews_delete_keyboard(p), parse_mode="HTML")
+
+@buttons.on(cb.REVIEWS_DELETE)
+async def reviews_delete_id(callback: CallbackQuery, payload: cb.ItemArgs):
+    rid, page, cursor = payload
+    await delete_review(rid)
     await callback.answer("Удалено ✅", show_alert=False)
 
-    total = count_reviews()
-    if total == 0:
+    # Перечитываем ту же страницу от её первой строки; если она опустела — шаг назад
+    p = await page_reviews(page, cursor, PAGE_SIZE)
+    if not p.items and cursor:
+        p = await page_reviews(max(page - 1, 0), "p" + cursor[1:], PAGE_SIZE)
+    if p.total == 0:
         await callback.message.edit_text("Все отзывы удалены. Чисто как в океане после шторма. 🌊", reply_markup=get_reviews_menu())
         return
-    page = min(page, max((total - 1) // PAGE_SIZE, 0))
-    items = list_reviews(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    text = f"🗑 <b>Удаление отзывов</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите отзыв:"
-    await callback.message.edit_text(text, reply_markup=get_reviews_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
+    text = f"🗑 <b>Удаление отзывов</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите отзыв:"
+    await callback.message.edit_text(text, reply_markup=get_reviews_delete_keyboard(p), parse_mode="HTML")
 
 
 # ---------- Услуги (админ) ----------
-@router.callback_query(F.data == "services_menu")
+@buttons.on(cb.SERVICES_MENU)
 async def services_menu(callback: CallbackQuery):
     text = (
         "🛠 <b>Управление услугами</b>\n\n"
@@ -319,17 +413,13 @@ async def services_menu(callback: CallbackQuery):
     )
     await callback.message.edit_text(text, reply_markup=get_services_menu(), parse_mode="HTML")
 
-@router.callback_query(F.data.startswith("services_view_page:"))
-async def services_view_page(callback: CallbackQuery):
-    try:
-        page = int(callback.data.split(":")[1])
-    except Exception:
-        page = 0
-
-    total = count_services()
+@buttons.on(cb.SERVICES_VIEW_PAGE)
+async def services_view_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    r = pages.get("services_view", page, cursor) or pages.get("services_view")
 
     # Когда услуг нет — показываем меню, но безопасно
-    if total == 0:
+    if r is None:
         text = "Пока услуг нет. Добавьте первую — и начнём продавать! 🚀"
         kb = get_services_menu()
         try:
@@ -346,17 +436,8 @@ async def services_view_page(callback: CallbackQuery):
             await callback.message.answer(text, reply_markup=kb)
         return
 
-    # Есть услуги — рисуем страницу
-    items = list_services(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    blocks = []
-    for _id, name, desc, file_path in items:
-        line = f"• <b>{name}</b>\n{desc[:300]}"
-        if file_path:
-            line += "\n📎 есть вложение"
-        blocks.append(line)
-
-    text = f"👀 <b>Список услуг</b> — страница <b>{page+1}</b>\n\n" + "\n\n".join(blocks)
-    kb = get_services_view_keyboard(page, PAGE_SIZE, total)
+    # Есть услуги — страница уже собрана
+    text, kb = r.text, r.markup
 
     try:
         if callback.message.text:
@@ -370,7 +451,7 @@ async def services_view_page(callback: CallbackQuery):
         await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
 
 
-@router.callback_query(F.data == "services_add")
+@buttons.on(cb.SERVICES_ADD)
 async def services_add_start(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     prompt = await callback.message.answer(
@@ -396,7 +477,7 @@ async def services_add_name(message: Message, state: FSMContext):
 async def services_add_desc(message: Message, state: FSMContext):
     await state.update_data(description=message.text.strip())
     await _remember(state, message)
-    os.makedirs(SERVICES_FOLDER, exist_ok=True)
+    os.makedirs(media_folder(SERVICES_FOLDER), exist_ok=True)
     prompt = await message.answer(
         "📎 Прикрепите <b>файл</b> (фото/документ) или нажмите «Пропустить».\n\n"
         "Визуал повышает конверсию! 🧲",
@@ -406,17 +487,17 @@ async def services_add_desc(message: Message, state: FSMContext):
     await _remember(state, prompt)
     await state.set_state(ServiceFSM.waiting_file)
 
-# принимаем И старый, и новый коллбэк: services_skip_file / skip_file
-@router.callback_query((F.data == "services_skip_file") | (F.data == "skip_file"))
+# «Пропустить файл» общий для мастеров услуг и подарков
+@buttons.on(cb.SKIP_FILE, state=(ServiceFSM.waiting_file, GiftFSM.waiting_file))
 async def services_or_gifts_skip_file(callback: CallbackQuery, state: FSMContext, bot: Bot):
     state_name = (await state.get_state()) or ""
     data = await state.get_data()
     if state_name.startswith("ServiceFSM"):
-        add_service(data["name"], data["description"], None)
+        await add_service(data["name"], data["description"], None)
         msg = "✅ Услуга добавлена (без файла). Чётко и по делу!"
     else:
         # GiftFSM
-        add_gift(data["name"], data["description"], None)
+        await add_gift(data["name"], data["description"], None)
         msg = "✅ Подарок добавлен (без файла). Пусть будет больше радости!"
     await _purge(state, bot)
     await state.clear()
@@ -424,57 +505,50 @@ async def services_or_gifts_skip_file(callback: CallbackQuery, state: FSMContext
 
 @router.message(ServiceFSM.waiting_file, F.photo | F.document)
 async def services_add_file(message: Message, state: FSMContext, bot: Bot):
-    os.makedirs(SERVICES_FOLDER, exist_ok=True)
-    file_path = None
-    if message.photo:
-        tg_file = await bot.get_file(message.photo[-1].file_id)
-        file_path = os.path.join(SERVICES_FOLDER, f"{uuid4()}.jpg")
-        await bot.download_file(tg_file.file_path, file_path)
-    elif message.document:
-        doc = message.document
-        tg_file = await bot.get_file(doc.file_id)
-        ext = os.path.splitext(doc.file_name or "")[1] or ".bin"
-        file_path = os.path.join(SERVICES_FOLDER, f"{uuid4()}{ext if len(ext) <= 10 else '.bin'}")
-        await bot.download_file(tg_file.file_path, file_path)
+    try:
+        file_path = await _ingest_attachment(message, bot, media_folder(SERVICES_FOLDER))
+    except MediaTooLarge as err:
+        await _too_large(message, state, err)
+        return
+    images.schedule(file_path)
 
     await _remember(state, message)
     d = await state.get_data()
-    add_service(d["name"], d["description"], file_path)
+    await add_service(d["name"], d["description"], file_path)
 
     await _purge(state, bot)
     await state.clear()
     await message.answer("✅ Услуга добавлена! Супер! 🔥")
 
-@router.callback_query(F.data.startswith("services_delete_page:"))
-async def services_delete_page(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1]) if ":" in callback.data else 0
-    total = count_services()
-    if total == 0:
+@buttons.on(cb.SERVICES_DELETE_PAGE)
+async def services_delete_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    p = await page_services(page, cursor, PAGE_SIZE)
+    if p.total == 0:
         await callback.message.edit_text("Пока услуг нет. Самое время добавить первую. ✨", reply_markup=get_services_menu())
         return
-    items = list_services(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    text = f"🗑 <b>Удаление услуг</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите услугу:"
-    await callback.message.edit_text(text, reply_markup=get_services_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
-
-@router.callback_query(F.data.startswith("services_delete_id:"))
-async def services_delete_id(callback: CallbackQuery):
-    _, sid, page = callback.data.split(":")
-    sid, page = int(sid), int(page)
-    delete_service(sid)
+    text = f"🗑 <b>Удаление услуг</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите услугу:"
+    await callback.message.edit_text(text, reply_markup=get_services_delete_keyboard(p), parse_mode="HTML")
+
+@buttons.on(cb.SERVICES_DELETE)
+async def services_delete_id(callback: CallbackQuery, payload: cb.ItemArgs):
+    sid, page, cursor = payload
+    await delete_service(sid)
     await callback.answer("Удалено ✅", show_alert=False)
 
-    total = count_services()
-    if total == 0:
+    # Перечитываем ту же страницу от её первой строки; если она опустела — шаг назад
+    p = await page_services(page, cursor, PAGE_SIZE)
+    if not p.items and cursor:
+        p = await page_services(max(page - 1, 0), "p" + cursor[1:], PAGE_SIZE)
+    if p.total == 0:
         await callback.message.edit_text("Все услуги удалены. Возьмём курс на обновление! 🧭", reply_markup=get_services_menu())
         return
-    page = min(page, max((total - 1) // PAGE_SIZE, 0))
-    items = list_services(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    text = f"🗑 <b>Удаление услуг</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите услугу:"
-    await callback.message.edit_text(text, reply_markup=get_services_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
+    text = f"🗑 <b>Удаление услуг</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите услугу:"
+    await callback.message.edit_text(text, reply_markup=get_services_delete_keyboard(p), parse_mode="HTML")
 
 
 # ---------- Подарки (админ) ----------
-@router.callback_query(F.data == "gifts_menu")
+@buttons.on(cb.GIFTS_MENU)
 async def gifts_menu(callback: CallbackQuery):
     text = (
         "🎁 <b>Управление подарками</b>\n\n"
@@ -482,24 +556,16 @@ async def gifts_menu(callback: CallbackQuery):
     )
     await callback.message.edit_text(text, reply_markup=get_gifts_menu(), parse_mode="HTML")
 
-@router.callback_query(F.data.startswith("gifts_view_page:"))
-async def gifts_view_page(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1]) if ":" in callback.data else 0
-    total = count_gifts()
-    if total == 0:
+@buttons.on(cb.GIFTS_VIEW_PAGE)
+async def gifts_view_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    r = pages.get("gifts_view", page, cursor) or pages.get("gifts_view")
+    if r is None:
         await callback.message.edit_text("Пока подарков нет. Добавьте — и заискрится! ✨", reply_markup=get_gifts_menu())
         return
-    items = list_gifts(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    blocks = []
-    for _id, name, desc, file_path in items:
-        line = f"• <b>{name}</b>\n{desc[:300]}"
-        if file_path:
-            line += "\n📎 есть вложение"
-        blocks.append(line)
-    text = f"👀 <b>Список подарков</b> — страница <b>{page+1}</b>\n\n" + "\n\n".join(blocks)
-    await callback.message.edit_text(text, reply_markup=get_gifts_view_keyboard(page, PAGE_SIZE, total), parse_mode="HTML")
-
-@router.callback_query(F.data == "gifts_add")
+    await callback.message.edit_text(r.text, reply_markup=r.markup, parse_mode="HTML")
+
+@buttons.on(cb.GIFTS_ADD)
 async def gifts_add_start(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     prompt = await callback.message.answer(
@@ -525,7 +591,7 @@ async def gifts_add_name(message: Message, state: FSMContext):
 async def gifts_add_desc(message: Message, state: FSMContext):
     await state.update_data(description=message.text.strip())
     await _remember(state, message)
-    os.makedirs(GIFTS_FOLDER, exist_ok=True)
+    os.makedirs(media_folder(GIFTS_FOLDER), exist_ok=True)
     prompt = await message.answer(
         "📎 Прикрепите <b>файл</b> (фото/документ) или нажмите «Пропустить».\n"
         "Красивый визуал — полдела! 🔥",
@@ -537,53 +603,94 @@ async def gifts_add_desc(message: Message, state: FSMContext):
 
 @router.message(GiftFSM.waiting_file, F.photo | F.document)
 async def gifts_add_file(message: Message, state: FSMContext, bot: Bot):
-    os.makedirs(GIFTS_FOLDER, exist_ok=True)
-    file_path = None
-    if message.photo:
-        tg_file = await bot.get_file(message.photo[-1].file_id)
-        file_path = os.path.join(GIFTS_FOLDER, f"{uuid4()}.jpg")
-        await bot.download_file(tg_file.file_path, file_path)
-    elif message.document:
-        doc = message.document
-        tg_file = await bot.get_file(doc.file_id)
-        ext = os.path.splitext(doc.file_name or "")[1] or ".bin"
-        file_path = os.path.join(GIFTS_FOLDER, f"{uuid4()}{ext if len(ext) <= 10 else '.bin'}")
-        await bot.download_file(tg_file.file_path, file_path)
+    try:
+        file_path = await _ingest_attachment(message, bot, media_folder(GIFTS_FOLDER))
+    except MediaTooLarge as err:
+        await _too_large(message, state, err)
+        return
+    images.schedule(file_path)
 
     await _remember(state, message)
     d = await state.get_data()
-    add_gift(d["name"], d["description"], file_path)
+    await add_gift(d["name"], d["description"], file_path)
 
     await _purge(state, bot)
     await state.clear()
     await message.answer("✅ Подарок добавлен! Пусть радует людей. 🎉")
 
-@router.callback_query(F.data.startswith("gifts_delete_page:"))
-async def gifts_delete_page(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1]) if ":" in callback.data else 0
-    total = count_gifts()
-    if total == 0:
+@buttons.on(cb.GIFTS_DELETE_PAGE)
+async def gifts_delete_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    p = await page_gifts(page, cursor, PAGE_SIZE)
+    if p.total == 0:
         await callback.message.edit_text("Пока подарков нет. Но это легко исправить 😉", reply_markup=get_gifts_menu())
         return
-    items = list_gifts(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    text = f"🗑 <b>Удаление подарков</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите подарок:"
-    await callback.message.edit_text(text, reply_markup=get_gifts_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
-
-@router.callback_query(F.data.startswith("gifts_delete_id:"))
-async def gifts_delete_id(callback: CallbackQuery):
-    _, gid, page = callback.data.split(":")
-    gid, page = int(gid), int(page)
-    delete_gift(gid)
+    text = f"🗑 <b>Удаление подарков</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите подарок:"
+    await callback.message.edit_text(text, reply_markup=get_gifts_delete_keyboard(p), parse_mode="HTML")
+
+@buttons.on(cb.GIFTS_DELETE)
+async def gifts_delete_id(callback: CallbackQuery, payload: cb.ItemArgs):
+    gid, page, cursor = payload
+    await delete_gift(gid)
     await callback.answer("Удалено ✅", show_alert=False)
 
-    total = count_gifts()
-    if total == 0:
+    # Перечитываем ту же страницу от её первой строки; если она опустела — шаг назад
+    p = await page_gifts(page, cursor, PAGE_SIZE)
+    if not p.items and cursor:
+        p = await page_gifts(max(page - 1, 0), "p" + cursor[1:], PAGE_SIZE)
+    if p.total == 0:
         await callback.message.edit_text("Все подарки удалены. Свободно дышим и готовим новые! 🌬️", reply_markup=get_gifts_menu())
         return
-    page = min(page, max((total - 1) // PAGE_SIZE, 0))
-    items = list_gifts(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    text = f"🗑 <b>Удаление подарков</b>\nСтраница: <b>{page+1}</b> • Всего: <b>{total}</b>\n\nВыберите подарок:"
-    await callback.message.edit_text(text, reply_markup=get_gifts_delete_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
+    text = f"🗑 <b>Удаление подарков</b>\nСтраница: <b>{p.page+1}</b> • Всего: <b>{p.total}</b>\n\nВыберите подарок:"
+    await callback.message.edit_text(text, reply_markup=get_gifts_delete_keyboard(p), parse_mode="HTML")
+
+
+# ---------- Рассылка ----------
+@buttons.on(cb.BROADCAST_NEW)
+async def broadcast_new(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in tenants.current().admin_ids:
+        return
+    prompt = await callback.message.answer(
+        "📣 Пришлите сообщение для рассылки — текст, фото, видео, что угодно.\n\n"
+        "Его получат <b>все пользователи</b>, которые запускали бота, ровно в таком виде.",
+        parse_mode="HTML"
+    )
+    await _remember(state, prompt)
+    await state.set_state(BroadcastFSM.waiting_message)
+
+@router.message(BroadcastFSM.waiting_message)
+async def broadcast_message(message: Message, state: FSMContext):
+    # Само сообщение не удаляем: рассылка копирует именно его
+    await state.update_data(from_chat_id=message.chat.id, message_id=message.message_id)
+    prompt = await message.answer(
+        "👆 Так сообщение увидят пользователи. Отправляем?",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
+    await _remember(state, prompt)
+    await state.set_state(BroadcastFSM.confirm)
+
+@buttons.on(cb.BROADCAST_CONFIRM, state=BroadcastFSM.confirm)
+async def broadcast_confirm(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    if callback.from_user.id not in tenants.current().admin_ids:
+        return
+    data = await state.get_data()
+    await _purge(state, bot)
+    await state.clear()
+    await broadcast.start(bot, data["from_chat_id"], data["message_id"], callback.message.chat.id)
+    await callback.answer("Рассылка запущена 🚀")
+
+@buttons.on(cb.BROADCAST_CANCEL)
+async def broadcast_cancel(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    await _purge(state, bot)
+    await state.clear()
+    await callback.message.answer("✖️ Рассылка отменена.")
+
+@buttons.on(cb.BROADCAST_STOP)
+async def broadcast_stop(callback: CallbackQuery, payload: cb.IdArgs):
+    if callback.from_user.id not in tenants.current().admin_ids:
+        return
+    await broadcast.stop(payload.item_id)
+    await callback.answer("Останавливаю рассылку…")
 
 
 # =====================================================================
@@ -592,60 +699,51 @@ async def gifts_delete_id(callback: CallbackQuery):
 
 # ----- Отзывы -----
 @router.message(F.text == "💬 Отзывы")
-async def u_reviews_root(message: Message):
-    total = count_reviews()
+async def u_reviews_root(message: Message, state: FSMContext, raw_state: str | None):
+    await _leave_search(state, raw_state)
+    events.record(message.from_user.id, "open_reviews")
+    first = pages.get("u_reviews")
     caption = (
         "💬 <b>Отзывы</b>\n\n"
         "Живые впечатления наших клиентов — лучше всякой рекламы. "
         "Выберите карточку, чтобы прочитать полностью. 👇"
     )
-    items = list_reviews(offset=0, limit=PAGE_SIZE)
 
     # если нет отзывов — всё равно показываем красивую картинку и текст
     img = _img_path("reviews")
     if img:
-        kb = get_user_reviews_keyboard(0, PAGE_SIZE, total, items) if total > 0 else None
-        await message.answer_photo(FSInputFile(img), caption=caption, parse_mode="HTML", reply_markup=kb)
+        kb = first.markup if first else None
+        await send_photo(message.answer_photo, img, caption=caption, parse_mode="HTML", reply_markup=kb)
     else:
-        if total == 0:
+        if first is None:
             await message.answer("✨ Пока отзывов нет. Но совсем скоро здесь появятся истории наших клиентов!", parse_mode="HTML")
         else:
-            await message.answer(caption, reply_markup=get_user_reviews_keyboard(0, PAGE_SIZE, total, items), parse_mode="HTML")
+            await message.answer(caption, reply_markup=first.markup, parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith("u_reviews_page:"))
-async def u_reviews_page(callback: CallbackQuery):
-    page = int(callback.data.split(":")[1]) if ":" in callback.data else 0
-    total = count_reviews()
-    items = list_reviews(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    if not items:
+@buttons.on(cb.U_REVIEWS_PAGE)
+async def u_reviews_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    r = pages.get("u_reviews", page, cursor)
+    if r is None:
         await callback.answer("Больше отзывов нет. 📚", show_alert=True)
         return
-    text = (
-        f"💬 <b>Отзывы</b> — страница <b>{page+1}</b>\n\n"
-        "Выберите отзыв, чтобы открыть его целиком."
-    )
-    await callback.message.edit_text(text, reply_markup=get_user_reviews_keyboard(page, PAGE_SIZE, total, items), parse_mode="HTML")
+    await callback.message.edit_text(r.text, reply_markup=r.markup, parse_mode="HTML")
 
-@router.callback_query(F.data.startswith("u_review_id:"))
-async def u_review_open(callback: CallbackQuery):
-    # u_review_id:{id}:{page}
-    try:
-        _, rid, page = callback.data.split(":")
-        rid, page = int(rid), int(page)
-    except Exception:
-        await callback.answer("Ошибка данных.", show_alert=True)
-        return
+@buttons.on(cb.U_REVIEW)
+async def u_review_open(callback: CallbackQuery, payload: cb.ItemArgs):
+    rid, page, cursor = payload
 
-    row = get_review_by_id(rid)
+    row = catalog.current().reviews.get(rid)
     if not row:
         await callback.answer("Отзыв не найден.", show_alert=True)
         return
 
+    events.record(callback.from_user.id, "view_review", rid)
     _id, author, text, date = row
     msg = f"🧑 <b>{author}</b>\n🗓 {date}\n\n{(text or '').strip()}"
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=f"u_reviews_page:{page}")]
+        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=cb.pack(cb.U_REVIEWS_PAGE, page, cursor))]
     ])
 
     # Если предыдущее сообщение было фото/документ — у него нет .text, тогда шлём новое
@@ -662,40 +760,36 @@ async def u_review_open(callback: CallbackQuery):
 
 # ----- Услуги -----
 @router.message(F.text == "🛠 Услуги")
-async def u_services_root(message: Message):
-    total = count_services()
+async def u_services_root(message: Message, state: FSMContext, raw_state: str | None):
+    await _leave_search(state, raw_state)
+    events.record(message.from_user.id, "open_services")
+    first = pages.get("u_services")
     caption = (
         "🛠 <b>Услуги</b>\n\n"
         "Наша экспертиза — ваша сила. Откройте карточку, чтобы узнать детали и посмотреть вложения. 👇"
     )
-    items = list_services(offset=0, limit=PAGE_SIZE)
 
     img = _img_path("services")
     if img:
-        kb = get_user_services_keyboard(0, PAGE_SIZE, total, items) if total > 0 else None
-        await message.answer_photo(FSInputFile(img), caption=caption, parse_mode="HTML", reply_markup=kb)
+        kb = first.markup if first else None
+        await send_photo(message.answer_photo, img, caption=caption, parse_mode="HTML", reply_markup=kb)
     else:
-        if total == 0:
+        if first is None:
             await message.answer("✨ Пока услуг нет. Мы уже работаем над тем, чтобы порадовать вас новыми предложениями!", parse_mode="HTML")
         else:
-            await message.answer(caption, reply_markup=get_user_services_keyboard(0, PAGE_SIZE, total, items), parse_mode="HTML")
+            await message.answer(caption, reply_markup=first.markup, parse_mode="HTML")
 
 
 # --- Пользователь: Услуги — пагинация ---
-@router.callback_query(F.data.startswith("u_services_page:"))
-async def u_services_page(callback: CallbackQuery):
-    try:
-        page = int(callback.data.split(":")[1])
-    except Exception:
-        page = 0
-    total = count_services()
-    items = list_services(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    if not items:
+@buttons.on(cb.U_SERVICES_PAGE)
+async def u_services_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    r = pages.get("u_services", page, cursor)
+    if r is None:
         await callback.answer("Больше услуг нет. 📘", show_alert=True)
         return
 
-    text = f"🛠 <b>Услуги</b> — страница <b>{page+1}</b>\nВыберите карточку ниже."
-    kb = get_user_services_keyboard(page, PAGE_SIZE, total, items)
+    text, kb = r.text, r.markup
 
     # Если текsta нет (например, предыдущее сообщение было с фото/документом) — отправим новое сообщение
     if callback.message.text:
@@ -704,68 +798,60 @@ async def u_services_page(callback: CallbackQuery):
         await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith("u_service_id:"))
-async def u_service_open(callback: CallbackQuery):
-    try:
-        _, sid, page = callback.data.split(":")
-        sid, page = int(sid), int(page)
-    except Exception:
-        await callback.answer("Ошибка данных.", show_alert=True)
-        return
-    row = get_service_by_id(sid)
+@buttons.on(cb.U_SERVICE)
+async def u_service_open(callback: CallbackQuery, payload: cb.ItemArgs):
+    sid, page, cursor = payload
+    row = catalog.current().services.get(sid)
     if not row:
         await callback.answer("Услуга не найдена.", show_alert=True)
         return
+    events.record(callback.from_user.id, "view_service", sid)
     _id, name, description, file_path = row
     text = f"🛠 <b>{name}</b>\n\n{description}"
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=f"u_services_page:{page}")]
+        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=cb.pack(cb.U_SERVICES_PAGE, page, cursor))]
     ])
     if file_path and os.path.exists(file_path):
         if _is_image(file_path):
-            await callback.message.answer_photo(FSInputFile(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
+            await send_photo(callback.message.answer_photo, images.best_variant(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
         else:
-            await callback.message.answer_document(FSInputFile(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
+            await send_document(callback.message.answer_document, file_path, caption=text, parse_mode="HTML", reply_markup=kb)
     else:
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
 
 # ----- Подарок -----
 @router.message(F.text == "🎁 Подарок")
-async def u_gifts_root(message: Message):
-    total = count_gifts()
+async def u_gifts_root(message: Message, state: FSMContext, raw_state: str | None):
+    await _leave_search(state, raw_state)
+    events.record(message.from_user.id, "open_gifts")
+    first = pages.get("u_gifts")
     caption = (
         "🎁 <b>Подарки</b>\n\n"
         "Самые тёплые бонусы и спецпредложения. Откройте карточку и заберите своё. 👇"
     )
-    items = list_gifts(offset=0, limit=PAGE_SIZE)
 
     img = _img_path("gifts")
     if img:
-        kb = get_user_gifts_keyboard(0, PAGE_SIZE, total, items) if total > 0 else None
-        await message.answer_photo(FSInputFile(img), caption=caption, parse_mode="HTML", reply_markup=kb)
+        kb = first.markup if first else None
+        await send_photo(message.answer_photo, img, caption=caption, parse_mode="HTML", reply_markup=kb)
     else:
-        if total == 0:
+        if first is None:
             await message.answer("✨ Пока подарков нет. Совсем скоро тут будут приятные сюрпризы. 🎀", parse_mode="HTML")
         else:
-            await message.answer(caption, reply_markup=get_user_gifts_keyboard(0, PAGE_SIZE, total, items), parse_mode="HTML")
+            await message.answer(caption, reply_markup=first.markup, parse_mode="HTML")
 
 
 # --- Пользователь: Подарки — пагинация ---
-@router.callback_query(F.data.startswith("u_gifts_page:"))
-async def u_gifts_page(callback: CallbackQuery):
-    try:
-        page = int(callback.data.split(":")[1])
-    except Exception:
-        page = 0
-    total = count_gifts()
-    items = list_gifts(offset=page * PAGE_SIZE, limit=PAGE_SIZE)
-    if not items:
+@buttons.on(cb.U_GIFTS_PAGE)
+async def u_gifts_page(callback: CallbackQuery, payload: cb.PageArgs):
+    page, cursor = payload
+    r = pages.get("u_gifts", page, cursor)
+    if r is None:
         await callback.answer("Больше подарков нет. 🎁", show_alert=True)
         return
 
-    text = f"🎁 <b>Подарки</b> — страница <b>{page+1}</b>\nВыберите карточку ниже."
-    kb = get_user_gifts_keyboard(page, PAGE_SIZE, total, items)
+    text, kb = r.text, r.markup
 
     if callback.message.text:
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
@@ -773,45 +859,92 @@ async def u_gifts_page(callback: CallbackQuery):
         await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith("u_gift_id:"))
-async def u_gift_open(callback: CallbackQuery):
-    try:
-        _, gid, page = callback.data.split(":")
-        gid, page = int(gid), int(page)
-    except Exception:
-        await callback.answer("Ошибка данных.", show_alert=True)
-        return
-    row = get_gift_by_id(gid)
+@buttons.on(cb.U_GIFT)
+async def u_gift_open(callback: CallbackQuery, payload: cb.ItemArgs):
+    gid, page, cursor = payload
+    row = catalog.current().gifts.get(gid)
     if not row:
         await callback.answer("Подарок не найден.", show_alert=True)
         return
+    events.record(callback.from_user.id, "view_gift", gid)
     _id, name, description, file_path = row
     text = f"🎁 <b>{name}</b>\n\n{description}"
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=f"u_gifts_page:{page}")]
+        [InlineKeyboardButton(text="◀️ Назад к списку", callback_data=cb.pack(cb.U_GIFTS_PAGE, page, cursor))]
     ])
     if file_path and os.path.exists(file_path):
         if _is_image(file_path):
-            await callback.message.answer_photo(FSInputFile(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
+            await send_photo(callback.message.answer_photo, images.best_variant(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
         else:
-            await callback.message.answer_document(FSInputFile(file_path), caption=text, parse_mode="HTML", reply_markup=kb)
+            await send_document(callback.message.answer_document, file_path, caption=text, parse_mode="HTML", reply_markup=kb)
     else:
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
 
 # ----- Контакты -----
 @router.message(F.text == "📞 Контакты")
-async def u_contacts(message: Message):
+async def u_contacts(message: Message, state: FSMContext, raw_state: str | None):
+    await _leave_search(state, raw_state)
+    events.record(message.from_user.id, "open_contacts")
     caption = (
         "📞 <b>Остаёмся на связи!</b>\n\n"
         "Нажмите на кнопку ниже — и мы уже рядом. Если не ответим сразу, "
         "обязательно вернёмся с лучшим решением. 💬"
     )
     img = _img_path("contacts")
-    kb = get_contacts_keyboard(CONTACT_URL, CONTACT_BUTTON_TEXT)
+    tenant = tenants.current()
+    kb = get_contacts_keyboard(tenant.contact_url, tenant.contact_button_text)
 
     if img:
-        await message.answer_photo(FSInputFile(img), caption=caption, parse_mode="HTML", reply_markup=kb)
+        await send_photo(message.answer_photo, img, caption=caption, parse_mode="HTML", reply_markup=kb)
     else:
         await message.answer(caption, reply_markup=kb, parse_mode="HTML")
 
+
+# ----- Inline-режим (@bot запрос) -----
+@router.inline_query()
+async def u_inline(query: InlineQuery, bot: Bot):
+    me = await bot.me()
+    results = await inline.results_for(query.query, me.username)
+    await query.answer(results, cache_time=inline.CACHE_TIME, is_personal=False)
+
+
+# ----- Поиск -----
+async def _leave_search(state: FSMContext, raw_state: str | None):
+    """Вместо запроса открыли раздел — выходим из режима поиска (мастера админа не трогаем)."""
+    if raw_state == SearchFSM.waiting_query.state:
+        await state.clear()
+
+
+@router.message(F.text == "🔍 Поиск")
+async def u_search_hint(message: Message, state: FSMContext):
+    await state.set_state(SearchFSM.waiting_query)
+    await message.answer(
+        "🔍 <b>Поиск</b>\n\n"
+        "Просто напишите одно-два слова — например, «массаж» или «сертификат». "
+        "Поищу среди услуг, подарков и отзывов.",
+        parse_mode="HTML"
+    )
+
+
+# Запрос ищем только после кнопки «🔍 Поиск»: прочий текст (в том числе
+# в группах и от админов) поиском не считается. Регистрируется последним,
+# чтобы кнопки разделов срабатывали раньше.
+@router.message(SearchFSM.waiting_query, F.text, ~F.text.startswith("/"))
+async def u_search(message: Message, state: FSMContext):
+    await state.clear()
+    events.record(message.from_user.id, "search")
+    results = await search(message.text, SEARCH_LIMIT)
+    query = html.escape(message.text[:64])
+    if not results:
+        await message.answer(
+            f"🤷 По запросу «<b>{query}</b>» ничего не нашлось. "
+            "Нажмите «🔍 Поиск» и попробуйте другое слово.",
+            parse_mode="HTML"
+        )
+        return
+    await message.answer(
+        f"🔍 Нашлось по запросу «<b>{query}</b>»:",
+        reply_markup=get_search_results_keyboard(results),
+        parse_mode="HTML"
+    )
@@ -0,0 +1,100 @@
+"""Оптимизация загруженных картинок: уменьшенная копия для отправки.
+
+Для media/<folder>/<sha256>.<ext> рядом появляется <sha256>.opt.jpg —
+не больше MAX_SIDE по длинной стороне, без EXIF. Копия сохраняется,
+только если она меньше оригинала: уже сжатый файл после перекодирования
+часто только растёт, и тогда бот отправляет оригинал.
+
+Перекодирование идёт в пуле процессов, цикл событий не блокируется.
+Без Pillow модуль ничего не делает — бот отправляет оригиналы.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен
+    Image = ImageOps = None
+
+MAX_SIDE = 1600       # px, длинная сторона оптимизированной копии
+QUALITY = 82          # JPEG quality для копии
+POOL_WORKERS = 2
+
+VARIANTS = ("opt",)
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+_pool: ProcessPoolExecutor | None = None
+_tasks: set[asyncio.Task] = set()
+
+
+def variant_path(path: str, variant: str) -> str:
+    """media/services/<hash>.png -> media/services/<hash>.<variant>.jpg"""
+    return f"{os.path.splitext(path)[0]}.{variant}.jpg"
+
+
+def best_variant(path: str) -> str:
+    """Путь к оптимизированной копии, если она уже готова, иначе к оригиналу."""
+    opt = variant_path(path, "opt")
+    return opt if os.path.exists(opt) else path
+
+
+def _render(path: str):
+    """Выполняется в дочернем процессе."""
+    opt = variant_path(path, "opt")
+    tmp = f"{opt}.part"
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src)  # поворот применяем до того, как выбросим EXIF
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            flat = Image.new("RGB", img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel("A"))
+            img = flat
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        # exif/icc не передаём — метаданные в копию не попадают
+        img.save(tmp, "JPEG", quality=QUALITY, optimize=True, progressive=True)
+    if os.path.getsize(tmp) < os.path.getsize(path):
+        os.replace(tmp, opt)
+    else:
+        os.remove(tmp)  # копия не меньше оригинала — отправляем оригинал
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+    return _pool
+
+
+async def optimize(path: str):
+    """Собрать варианты для path (если это картинка и есть Pillow)."""
+    if Image is None or not path or os.path.splitext(path.lower())[1] not in IMAGE_EXTS:
+        return
+    if os.path.exists(variant_path(path, "opt")):
+        return  # тот же файл уже загружали — копия готова
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_get_pool(), _render, path)
+    except OSError as err:  # битый или неподдерживаемый файл — просто шлём оригинал
+        logging.warning("image optimization skipped for %s: %s", path, err)
+    except Exception:
+        logging.exception("image optimization failed for %s", path)
+
+
+def schedule(path: str | None):
+    """Запустить optimize в фоне, не задерживая ответ админу."""
+    if not path:
+        return
+    task = asyncio.create_task(optimize(path))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
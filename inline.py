@@ -0,0 +1,143 @@
+"""Inline-режим: `@bot <запрос>` в любом чате отдаёт карточки услуг, подарков и отзывов.
+
+Включается у @BotFather (/setinline). Результаты собираются один раз на
+нормализованный запрос и живут до смены версии каталога; Telegram сам
+кэширует ответ ещё на CACHE_TIME секунд. Фото отдаются по уже известным
+file_id (InlineQueryResultCachedPhoto) — загрузить файл из inline-ответа
+нельзя, поэтому карточки, чьё фото ещё ни разу не отправлялось, уходят
+текстом.
+"""
+import html
+import os
+import re
+
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InputTextMessageContent,
+)
+
+import async_db
+import catalog
+import images
+import tenants
+from file_registry import cached_file_id
+
+CACHE_TIME = 300        # сек, кэш ответа на стороне Telegram
+MAX_RESULTS = 50        # больше Telegram не принимает
+EMPTY_QUERY_ITEMS = 10  # на пустой запрос — столько свежих услуг и подарков
+CACHE_LIMIT = 1024      # запросов в памяти на одну версию каталога
+CAPTION_LIMIT = 1024    # лимиты Telegram на видимый текст (в UTF-16), иначе
+TEXT_LIMIT = 4096       # отклоняется весь answerInlineQuery
+TITLE_LIMIT = 256       # заголовок карточки — остальное место под описание
+
+_caches: dict[str, tuple[int, dict]] = {}   # имя бота -> (версия каталога, {запрос: результаты})
+
+_SECTIONS = {
+    "services": "🛠",
+    "gifts": "🎁",
+    "reviews": "💬",
+}
+
+
+def normalize(query: str) -> str:
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+def _snippet(text: str, limit: int = 100) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _fit(text: str, limit: int) -> str:
+    """Обрезать обычный (ещё не экранированный) текст до limit символов Telegram."""
+    units = text.encode("utf-16-le")
+    if len(units) <= limit * 2:
+        return text
+    # errors="ignore" отбрасывает разрезанную суррогатную пару
+    return units[:(limit - 1) * 2].decode("utf-16-le", "ignore") + "…"
+
+
+def _card(icon: str, title: str, body: str, limit: int, suffix: str = "") -> str:
+    """HTML карточки не длиннее limit видимых символов: режем до html.escape, не после."""
+    title = _fit(title, TITLE_LIMIT)
+    head = f"{icon} {title}{suffix}\n\n"
+    body = _fit(body, limit - len(head.encode("utf-16-le")) // 2)
+    return f"{icon} <b>{html.escape(title)}</b>{html.escape(suffix)}\n\n{html.escape(body)}"
+
+
+def _open_bot_markup(bot_username: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🤖 Открыть бота", url=f"https://t.me/{bot_username}")]
+    ])
+
+
+async def _result(section: str, row, markup: InlineKeyboardMarkup):
+    result_id = f"{section}:{row[0]}"
+    icon = _SECTIONS[section]
+    if section == "reviews":
+        _id, author, text, date = row
+        return InlineQueryResultArticle(
+            id=result_id,
+            title=f"{icon} {author} • {date}",
+            description=_snippet(text),
+            input_message_content=InputTextMessageContent(
+                message_text=_card(icon, author, text, TEXT_LIMIT, suffix=f" • {date}"),
+                parse_mode="HTML",
+            ),
+            reply_markup=markup,
+        )
+
+    _id, name, description, file_path = row
+    if file_path and os.path.splitext(file_path.lower())[1] in images.IMAGE_EXTS:
+        file_id = await cached_file_id(images.best_variant(file_path), "photo")
+        if file_id:
+            return InlineQueryResultCachedPhoto(
+                id=result_id,
+                photo_file_id=file_id,
+                title=f"{icon} {name}",
+                description=_snippet(description),
+                caption=_card(icon, name, description, CAPTION_LIMIT),
+                parse_mode="HTML",
+                reply_markup=markup,
+            )
+    return InlineQueryResultArticle(
+        id=result_id,
+        title=f"{icon} {name}",
+        description=_snippet(description),
+        input_message_content=InputTextMessageContent(
+            message_text=_card(icon, name, description, TEXT_LIMIT), parse_mode="HTML",
+        ),
+        reply_markup=markup,
+    )
+
+
+async def _build(query: str, bot_username: str) -> list:
+    snap = catalog.current()
+    if query:
+        found = await async_db.search(query, MAX_RESULTS)
+    else:
+        found = [("services", row[0], None) for row in snap.services.rows[:EMPTY_QUERY_ITEMS]]
+        found += [("gifts", row[0], None) for row in snap.gifts.rows[:EMPTY_QUERY_ITEMS]]
+
+    markup = _open_bot_markup(bot_username)
+    results = []
+    for section, item_id, _title in found:
+        row = getattr(snap, section).get(item_id)
+        if row is not None:
+            results.append(await _result(section, row, markup))
+    return results
+
+
+async def results_for(query: str, bot_username: str) -> list:
+    """Готовые inline-результаты для запроса (из кэша текущей версии каталога)."""
+    tenant = tenants.current().name
+    version = catalog.current().version
+    cache_version, cache = _caches.get(tenant, (-1, None))
+    if version != cache_version or len(cache) >= CACHE_LIMIT:
+        cache = {}
+        _caches[tenant] = (version, cache)
+    key = normalize(query)
+    results = cache.get(key)
+    if results is None:
+        results = cache[key] = await _build(key, bot_username)
+    return results
@@ -1,18 +1,61 @@
+from functools import cache, wraps
+
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardMarkup, KeyboardButton
 )
 
+import catalog
+import tenants
+from callbacks import (
+    pack,
+    SETTINGS, GREETING_MENU, GREETING_VIEW, GREETING_EDIT,
+    REVIEWS_MENU, REVIEWS_ADD, REVIEWS_DELETE_PAGE, REVIEWS_DELETE,
+    SERVICES_MENU, SERVICES_VIEW_PAGE, SERVICES_ADD, SERVICES_DELETE_PAGE, SERVICES_DELETE,
+    GIFTS_MENU, GIFTS_VIEW_PAGE, GIFTS_ADD, GIFTS_DELETE_PAGE, GIFTS_DELETE, SKIP_FILE,
+    BROADCAST_NEW, BROADCAST_CONFIRM, BROADCAST_CANCEL, BROADCAST_STOP,
+    U_REVIEWS_PAGE, U_REVIEW, U_SERVICES_PAGE, U_SERVICE, U_GIFTS_PAGE, U_GIFT,
+)
+from database import Page
+
+# Страничные клавиатуры удаления: (функция, страница, курсоры) -> готовая разметка.
+# Кэш у каждого бота свой, живёт в пределах одной версии контента и сбрасывается при её смене.
+# Клавиатуры просмотра кэшируются вместе с текстом страницы в pages.py.
+PAGE_CACHE_LIMIT = 2048
+_page_caches: dict[str, tuple[int, dict]] = {}   # имя бота -> (версия, {ключ: разметка})
+
+
+def _cached_page(builder):
+    """Мемоизация страничной клавиатуры по (раздел, страница, версия контента)."""
+    @wraps(builder)
+    def wrapper(p: Page):
+        tenant = tenants.current().name
+        version = catalog.current().version
+        cache_version, cache = _page_caches.get(tenant, (-1, None))
+        if version != cache_version or len(cache) >= PAGE_CACHE_LIMIT:
+            cache = {}
+            _page_caches[tenant] = (version, cache)
+        key = (builder.__name__, p.page, p.anchor, p.prev_cursor, p.next_cursor)
+        markup = cache.get(key)
+        if markup is None:
+            markup = cache[key] = builder(p)
+        return markup
+    return wrapper
+
+
 # ---------- Основные клавиатуры ----------
 
+@cache
 def get_user_keyboard():
     keyboard = [
         [KeyboardButton(text="💬 Отзывы"), KeyboardButton(text="🎁 Подарок")],
-        [KeyboardButton(text="🛠 Услуги"), KeyboardButton(text="📞 Контакты")]
+        [KeyboardButton(text="🛠 Услуги"), KeyboardButton(text="📞 Контакты")],
+        [KeyboardButton(text="🔍 Поиск")]
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
 
+@cache
 def get_admin_keyboard():
     keyboard = [
         [KeyboardButton(text="📊 Анализ"), KeyboardButton(text="⚙️ Настройки")]
@@ -20,215 +63,256 @@ def get_admin_keyboard():
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
 
+@cache
 def get_settings_keyboard():
     buttons = [
-        [InlineKeyboardButton(text="📝 Приветствие", callback_data="greeting_menu")],
-        [InlineKeyboardButton(text="💬 Отзывы", callback_data="edit_reviews")],
-        [InlineKeyboardButton(text="🛠 Услуги", callback_data="services_menu")],
-        [InlineKeyboardButton(text="🎁 Подарки", callback_data="gifts_menu")]
+        [InlineKeyboardButton(text="📝 Приветствие", callback_data=pack(GREETING_MENU))],
+        [InlineKeyboardButton(text="💬 Отзывы", callback_data=pack(REVIEWS_MENU))],
+        [InlineKeyboardButton(text="🛠 Услуги", callback_data=pack(SERVICES_MENU))],
+        [InlineKeyboardButton(text="🎁 Подарки", callback_data=pack(GIFTS_MENU))],
+        [InlineKeyboardButton(text="📣 Рассылка", callback_data=pack(BROADCAST_NEW))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 # ---------- Приветствие (подменю) ----------
+@cache
 def get_greeting_menu():
     buttons = [
-        [InlineKeyboardButton(text="✅ Посмотреть", callback_data="view_greeting")],
-        [InlineKeyboardButton(text="✏️ Редактировать", callback_data="edit_greeting")]
+        [InlineKeyboardButton(text="✅ Посмотреть", callback_data=pack(GREETING_VIEW))],
+        [InlineKeyboardButton(text="✏️ Редактировать", callback_data=pack(GREETING_EDIT))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 # ---------- Отзывы (админ) ----------
+@cache
 def get_reviews_menu():
     buttons = [
-        [InlineKeyboardButton(text="➕ Добавить отзыв", callback_data="reviews_add")],
-        [InlineKeyboardButton(text="🗑 Удалить отзыв", callback_data="reviews_delete_page:0")]
+        [InlineKeyboardButton(text="➕ Добавить отзыв", callback_data=pack(REVIEWS_ADD))],
+        [InlineKeyboardButton(text="🗑 Удалить отзыв", callback_data=pack(REVIEWS_DELETE_PAGE))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_reviews_delete_keyboard(page: int, page_size: int, total: int, items):
+@_cached_page
+def get_reviews_delete_keyboard(p: Page):
     rows = []
-    for r_id, author, text, date in items:
+    for r_id, author, text, date in p.items:
         label = f"🗑 {author} • {date}"
         rows.append([InlineKeyboardButton(
             text=label[:64],
-            callback_data=f"reviews_delete_id:{r_id}:{page}"
+            callback_data=pack(REVIEWS_DELETE, r_id, p.page, p.anchor)
         )])
 
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"reviews_delete_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"reviews_delete_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(REVIEWS_DELETE_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(REVIEWS_DELETE_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
 
-    rows.append([InlineKeyboardButton(text="↩️ В меню отзывов", callback_data="greeting_reviews_back")])
+    rows.append([InlineKeyboardButton(text="↩️ В меню отзывов", callback_data=pack(REVIEWS_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
 # ---------- Услуги (админ) ----------
+@cache
 def get_services_menu():
     buttons = [
-        [InlineKeyboardButton(text="👀 Посмотреть", callback_data="services_view_page:0")],
-        [InlineKeyboardButton(text="➕ Добавить", callback_data="services_add")],
-        [InlineKeyboardButton(text="🗑 Удалить", callback_data="services_delete_page:0")],
-        [InlineKeyboardButton(text="↩️ Назад к настройкам", callback_data="back_to_settings")]
+        [InlineKeyboardButton(text="👀 Посмотреть", callback_data=pack(SERVICES_VIEW_PAGE))],
+        [InlineKeyboardButton(text="➕ Добавить", callback_data=pack(SERVICES_ADD))],
+        [InlineKeyboardButton(text="🗑 Удалить", callback_data=pack(SERVICES_DELETE_PAGE))],
+        [InlineKeyboardButton(text="↩️ Назад к настройкам", callback_data=pack(SETTINGS))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_services_view_keyboard(page: int, page_size: int, total: int):
+def get_services_view_keyboard(p: Page):
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"services_view_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"services_view_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(SERVICES_VIEW_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(SERVICES_VIEW_PAGE, p.page+1, p.next_cursor)))
 
     rows = []
     if nav_row:
         rows.append(nav_row)
-    rows.append([InlineKeyboardButton(text="↩️ В меню услуг", callback_data="services_menu")])
+    rows.append([InlineKeyboardButton(text="↩️ В меню услуг", callback_data=pack(SERVICES_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def get_services_delete_keyboard(page: int, page_size: int, total: int, items):
+@_cached_page
+def get_services_delete_keyboard(p: Page):
     rows = []
-    for s_id, name, description, file_path in items:
+    for s_id, name, description, file_path in p.items:
         label = f"🗑 {name}"
         rows.append([InlineKeyboardButton(
             text=label[:64],
-            callback_data=f"services_delete_id:{s_id}:{page}"
+            callback_data=pack(SERVICES_DELETE, s_id, p.page, p.anchor)
         )])
 
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"services_delete_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"services_delete_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(SERVICES_DELETE_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(SERVICES_DELETE_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
 
-    rows.append([InlineKeyboardButton(text="↩️ В меню услуг", callback_data="services_menu")])
+    rows.append([InlineKeyboardButton(text="↩️ В меню услуг", callback_data=pack(SERVICES_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
 # ---------- Подарки (админ) ----------
+@cache
 def get_gifts_menu():
     buttons = [
-        [InlineKeyboardButton(text="👀 Посмотреть", callback_data="gifts_view_page:0")],
-        [InlineKeyboardButton(text="➕ Добавить", callback_data="gifts_add")],
-        [InlineKeyboardButton(text="🗑 Удалить", callback_data="gifts_delete_page:0")],
-        [InlineKeyboardButton(text="↩️ Назад к настройкам", callback_data="back_to_settings")]
+        [InlineKeyboardButton(text="👀 Посмотреть", callback_data=pack(GIFTS_VIEW_PAGE))],
+        [InlineKeyboardButton(text="➕ Добавить", callback_data=pack(GIFTS_ADD))],
+        [InlineKeyboardButton(text="🗑 Удалить", callback_data=pack(GIFTS_DELETE_PAGE))],
+        [InlineKeyboardButton(text="↩️ Назад к настройкам", callback_data=pack(SETTINGS))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_gifts_view_keyboard(page: int, page_size: int, total: int):
+def get_gifts_view_keyboard(p: Page):
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"gifts_view_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"gifts_view_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(GIFTS_VIEW_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(GIFTS_VIEW_PAGE, p.page+1, p.next_cursor)))
 
     rows = []
     if nav_row:
         rows.append(nav_row)
-    rows.append([InlineKeyboardButton(text="↩️ В меню подарков", callback_data="gifts_menu")])
+    rows.append([InlineKeyboardButton(text="↩️ В меню подарков", callback_data=pack(GIFTS_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def get_gifts_delete_keyboard(page: int, page_size: int, total: int, items):
+@_cached_page
+def get_gifts_delete_keyboard(p: Page):
     rows = []
-    for g_id, name, description, file_path in items:
+    for g_id, name, description, file_path in p.items:
         label = f"🗑 {name}"
         rows.append([InlineKeyboardButton(
             text=label[:64],
-            callback_data=f"gifts_delete_id:{g_id}:{page}"
+            callback_data=pack(GIFTS_DELETE, g_id, p.page, p.anchor)
         )])
 
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"gifts_delete_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"gifts_delete_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(GIFTS_DELETE_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(GIFTS_DELETE_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
 
-    rows.append([InlineKeyboardButton(text="↩️ В меню подарков", callback_data="gifts_menu")])
+    rows.append([InlineKeyboardButton(text="↩️ В меню подарков", callback_data=pack(GIFTS_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+# ---------- Рассылка (админ) ----------
+@cache
+def get_broadcast_confirm_keyboard():
+    buttons = [
+        [InlineKeyboardButton(text="✅ Отправить всем", callback_data=pack(BROADCAST_CONFIRM))],
+        [InlineKeyboardButton(text="✖️ Отмена", callback_data=pack(BROADCAST_CANCEL))]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_broadcast_stop_keyboard(broadcast_id: int):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏹ Остановить", callback_data=pack(BROADCAST_STOP, broadcast_id))]
+    ])
+
+
 # ---------- Пользовательские списки/детали ----------
 
-def get_user_reviews_keyboard(page: int, page_size: int, total: int, items):
+def get_user_reviews_keyboard(p: Page):
     rows = []
-    for r_id, author, text, date in items:
+    for r_id, author, text, date in p.items:
         label = f"💬 {author} • {date}"
         rows.append([InlineKeyboardButton(
             text=label[:64],
-            callback_data=f"u_review_id:{r_id}:{page}"
+            callback_data=pack(U_REVIEW, r_id, p.page, p.anchor)
         )])
 
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"u_reviews_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"u_reviews_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(U_REVIEWS_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(U_REVIEWS_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def get_user_services_keyboard(page: int, page_size: int, total: int, items):
+def get_user_services_keyboard(p: Page):
     rows = []
-    for s_id, name, description, file_path in items:
+    for s_id, name, description, file_path in p.items:
         rows.append([InlineKeyboardButton(
             text=f"🛠 {name}"[:64],
-            callback_data=f"u_service_id:{s_id}:{page}"
+            callback_data=pack(U_SERVICE, s_id, p.page, p.anchor)
         )])
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"u_services_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"u_services_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(U_SERVICES_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(U_SERVICES_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def get_user_gifts_keyboard(page: int, page_size: int, total: int, items):
+def get_user_gifts_keyboard(p: Page):
     rows = []
-    for g_id, name, description, file_path in items:
+    for g_id, name, description, file_path in p.items:
         rows.append([InlineKeyboardButton(
             text=f"🎁 {name}"[:64],
-            callback_data=f"u_gift_id:{g_id}:{page}"
+            callback_data=pack(U_GIFT, g_id, p.page, p.anchor)
         )])
     nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"u_gifts_page:{page-1}"))
-    if (page + 1) * page_size < total:
-        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"u_gifts_page:{page+1}"))
+    if p.prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(U_GIFTS_PAGE, p.page-1, p.prev_cursor)))
+    if p.next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(U_GIFTS_PAGE, p.page+1, p.next_cursor)))
     if nav_row:
         rows.append(nav_row)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+# Результаты поиска: те же callback'и, что и в списках (карточка откроется с «Назад» на 1-ю страницу)
+SEARCH_RESULT_BUTTONS = {
+    "reviews": ("💬", U_REVIEW),
+    "services": ("🛠", U_SERVICE),
+    "gifts": ("🎁", U_GIFT),
+}
+
+
+def get_search_results_keyboard(results):
+    rows = []
+    for section, item_id, title in results:
+        icon, op = SEARCH_RESULT_BUTTONS[section]
+        rows.append([InlineKeyboardButton(text=f"{icon} {title}"[:64], callback_data=pack(op, item_id))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 # Контакты — одна кнопка «Перейти» с URL
+@cache
 def get_contacts_keyboard(url: str, text: str):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"➡️ {text}", url=url)]
     ])
 
 
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-
+@cache
 def get_skip_file_keyboard():
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="⏭ Пропустить файл", callback_data="skip_file")]
+            [InlineKeyboardButton(text="⏭ Пропустить файл", callback_data=pack(SKIP_FILE))]
         ]
     )
     return keyboard
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import os
+from uuid import uuid4
+
+from aiogram import Bot
+
+import tenants
+
+# Папки с загруженными админом файлами (их чистит media_gc) —
+# внутри медиа-корня текущего бота, см. folder()
+GREETING_FOLDER = "greetings"
+SERVICES_FOLDER = "services"
+GIFTS_FOLDER = "gifts"
+UPLOAD_FOLDERS = (GREETING_FOLDER, SERVICES_FOLDER, GIFTS_FOLDER)
+
+# Лимиты на размер входящих файлов (байт). Bot API всё равно не отдаёт больше 20 МБ.
+MAX_SIZE = {
+    "photo": 10 * 1024 * 1024,
+    "document": 20 * 1024 * 1024,
+}
+CHUNK_SIZE = 256 * 1024
+
+
+def folder(name: str) -> str:
+    """Путь к папке name в медиа-корне текущего бота (по умолчанию media/<name>)."""
+    return os.path.join(tenants.current().media_root, name)
+
+
+class MediaTooLarge(Exception):
+    def __init__(self, kind: str, limit: int):
+        super().__init__(f"{kind} exceeds {limit} bytes")
+        self.kind = kind
+        self.limit = limit
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _copy_local(src: str, tmp_path: str, kind: str, limit: int) -> str:
+    """Локальный Bot API: файл уже на диске — копируем с хэшем. Вернёт sha256."""
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(src, "rb") as fin, open(tmp_path, "wb") as fout:
+            while chunk := fin.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise MediaTooLarge(kind, limit)
+                _write_chunk(fout, digest, chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest()
+
+
+async def _download(bot: Bot, file_path: str, tmp_path: str, kind: str, limit: int) -> str:
+    """Скачать файл с Bot API потоком в tmp_path. Вернёт sha256."""
+    digest = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        url = bot.session.api.file_url(bot.token, file_path)
+        async for chunk in bot.session.stream_content(url=url, chunk_size=CHUNK_SIZE, raise_for_status=True):
+            size += len(chunk)
+            if size > limit:
+                raise MediaTooLarge(kind, limit)
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(_discard, f, tmp_path)
+        raise
+    return digest.hexdigest()
+
+
+def _finalize(tmp_path: str, final_path: str):
+    # Такой файл уже есть — это дубль, второй экземпляр не храним.
+    # mtime обновляем, чтобы сборщик мусора не удалил его, пока на него нет ссылки.
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        os.utime(final_path)
+    else:
+        os.replace(tmp_path, final_path)
+
+
+def _discard(f, tmp_path: str):
+    f.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def ingest(bot: Bot, file_id: str, folder: str, ext: str, kind: str,
+                 declared_size: int | None = None) -> str:
+    """Скачать файл Telegram потоком в folder/<sha256><ext> и вернуть путь.
+
+    С локальным сервером Bot API (api.is_local) файл копируется с диска.
+    Размер проверяется до загрузки (по данным Telegram) и во время неё;
+    при превышении — MediaTooLarge. Диск трогаем только из пула потоков,
+    одинаковое содержимое хранится один раз.
+    """
+    limit = MAX_SIZE[kind]
+    if declared_size and declared_size > limit:
+        raise MediaTooLarge(kind, limit)
+
+    tg_file = await bot.get_file(file_id)
+    if tg_file.file_size and tg_file.file_size > limit:
+        raise MediaTooLarge(kind, limit)
+
+    await asyncio.to_thread(os.makedirs, folder, exist_ok=True)
+    tmp_path = os.path.join(folder, f".{uuid4().hex}.part")
+    api = bot.session.api
+    if api.is_local:
+        # file_path — путь на диске сервера Bot API, а не URL
+        src = str(api.wrap_local_file.to_local(tg_file.file_path))
+        sha = await asyncio.to_thread(_copy_local, src, tmp_path, kind, limit)
+    else:
+        sha = await _download(bot, tg_file.file_path, tmp_path, kind, limit)
+
+    final_path = os.path.join(folder, f"{sha}{ext}")
+    await asyncio.to_thread(_finalize, tmp_path, final_path)
+    return final_path
@@ -0,0 +1,136 @@
+"""Сборщик мусора для media/greetings, media/services и media/gifts
+(медиа-корень текущего бота, см. tenants).
+
+Удаляет файлы, на которые больше не ссылается ни приветствие, ни услуги,
+ни подарки. Оптимизированные копии (images.py) живут, пока
+жив оригинал. Свежие файлы (моложе GRACE_PERIOD) не трогаются: это и
+незавершённые мастера админа, и недокачанные .part.
+
+Запуск вручную (из корня проекта):
+
+    python media_gc.py --dry-run      # только отчёт
+    python media_gc.py --grace 0      # удалить всё лишнее сразу
+    python media_gc.py --bot spa      # только один бот из BOTS_CONFIG
+
+Без --bot проходятся все боты из BOTS_CONFIG (без конфига — единственный).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+import async_db
+import images
+import tenants
+from config import BOTS_CONFIG
+from database import init_db
+from media import UPLOAD_FOLDERS, folder as media_folder
+
+GC_INTERVAL = 6 * 3600      # как часто запускать проход в фоне, сек
+GRACE_PERIOD = 24 * 3600    # минимальный возраст файла для удаления, сек
+BATCH_SIZE = 200            # файлов за один заход в пул потоков
+
+
+@dataclass
+class Report:
+    dry_run: bool
+    scanned: int = 0
+    kept: int = 0
+    too_young: int = 0
+    removed: list[str] = field(default_factory=list)
+    freed_bytes: int = 0
+
+    def __str__(self) -> str:
+        action = "would remove" if self.dry_run else "removed"
+        lines = [
+            f"scanned {self.scanned} files: {self.kept} referenced, "
+            f"{self.too_young} within grace period, {action} {len(self.removed)} "
+            f"({self.freed_bytes / 1024 / 1024:.1f} MB)"
+        ]
+        lines += [f"  {path}" for path in self.removed]
+        return "\n".join(lines)
+
+
+def _list_files(folder: str) -> list[str]:
+    try:
+        with os.scandir(folder) as it:
+            return [entry.path for entry in it if entry.is_file(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def _sweep(paths: list[str], referenced: set[str], cutoff: float, report: Report):
+    for path in paths:
+        report.scanned += 1
+        if os.path.normpath(path) in referenced:
+            report.kept += 1
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if st.st_mtime > cutoff:
+            report.too_young += 1
+            continue
+        if not report.dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+        report.removed.append(path)
+        report.freed_bytes += st.st_size
+
+
+async def collect(dry_run: bool = False, grace: float = GRACE_PERIOD) -> Report:
+    """Один проход по папкам. Работает пачками, диск — только в пуле потоков."""
+    report = Report(dry_run=dry_run)
+    cutoff = time.time() - grace
+    for name in UPLOAD_FOLDERS:
+        paths = await asyncio.to_thread(_list_files, media_folder(name))
+        for i in range(0, len(paths), BATCH_SIZE):
+            # Ссылки перечитываем на каждую пачку: контент могли поменять за время прохода
+            referenced = await async_db.referenced_media()
+            referenced |= {images.variant_path(p, v) for p in referenced for v in images.VARIANTS}
+            await asyncio.to_thread(_sweep, paths[i:i + BATCH_SIZE], referenced, cutoff, report)
+    if report.removed and not dry_run:
+        await async_db.forget_file_ids_for(report.removed)
+    return report
+
+
+async def run_forever(interval: float = GC_INTERVAL):
+    """Фоновая задача бота (запускается в его контексте): периодическая сборка мусора."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await collect()
+            if report.removed:
+                logging.info("media gc: %s", report)
+        except Exception:
+            logging.exception("media gc failed")
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+    parser.add_argument("--grace", type=float, default=GRACE_PERIOD / 3600, help="часов, которые файл не трогаем")
+    parser.add_argument("--bot", help="имя бота из BOTS_CONFIG (по умолчанию — все)")
+    args = parser.parse_args()
+    bots = tenants.load(BOTS_CONFIG)
+    if args.bot:
+        bots = [t for t in bots if t.name == args.bot]
+        if not bots:
+            parser.error(f"unknown bot: {args.bot}")
+    try:
+        for tenant in bots:
+            with tenants.use(tenant):
+                await async_db.run(init_db)
+                report = await collect(dry_run=args.dry_run, grace=args.grace * 3600)
+            print(f"[{tenant.name}] {report}")
+    finally:
+        async_db.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,193 @@
+"""Метрики бота в формате Prometheus.
+
+Запись — это пара словарных операций и bisect (наносекунды), текст для
+Prometheus собирается только когда кто-то приходит на METRICS_PATH.
+
+Что собираем:
+
+* bot_updates_total{type}            — входящие апдейты по типу
+* bot_handler_seconds{handler}       — время хендлеров (гистограмма)
+* bot_handler_errors_total{handler}  — хендлер упал с исключением
+* bot_db_seconds{call}               — вызовы database.* через async_db
+* bot_api_seconds{method}            — запросы к Bot API (без ожидания в send_scheduler)
+* bot_api_errors_total{method}
+* gauges, зарегистрированные через register_gauge (очередь отправки и т. п.)
+"""
+import bisect
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "bot_updates_total": ("counter", "Incoming updates by event type"),
+    "bot_handler_seconds": ("histogram", "Handler latency"),
+    "bot_handler_errors_total": ("counter", "Handlers that raised"),
+    "bot_db_seconds": ("histogram", "Database calls through async_db, including queueing"),
+    "bot_api_seconds": ("histogram", "Bot API request latency"),
+    "bot_api_errors_total": ("counter", "Failed Bot API requests"),
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (метрика, значение метки) -> Histogram / число
+_histograms: dict[tuple[str, str], Histogram] = {}
+_counters: dict[tuple[str, str], int] = {}
+# имя -> (help, имя метки, функция без аргументов -> {значение метки: число})
+_gauges: dict[str, tuple[str, str, Callable[[], dict]]] = {}
+
+# Имя единственной метки каждой метрики
+LABELS = {
+    "bot_updates_total": "type",
+    "bot_handler_seconds": "handler",
+    "bot_handler_errors_total": "handler",
+    "bot_db_seconds": "call",
+    "bot_api_seconds": "method",
+    "bot_api_errors_total": "method",
+}
+
+
+def observe(name: str, label: str, value: float):
+    hist = _histograms.get((name, label))
+    if hist is None:
+        hist = _histograms[(name, label)] = Histogram()
+    hist.observe(value)
+
+
+def inc(name: str, label: str, value: int = 1):
+    key = (name, label)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def register_gauge(name: str, help_text: str, label: str, collect: Callable[[], dict]):
+    """collect() вызывается только при чтении метрик."""
+    _gauges[name] = (help_text, label, collect)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    lines = []
+    by_name: dict[str, list] = {}
+    for (name, label), value in list(_counters.items()) + list(_histograms.items()):
+        by_name.setdefault(name, []).append((label, value))
+
+    for name, items in sorted(by_name.items()):
+        kind, help_text = HELP[name]
+        key = LABELS[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label, value in sorted(items, key=lambda x: x[0]):
+            lbl = f'{key}="{_escape(label)}"'
+            if kind == "counter":
+                lines.append(f"{name}{{{lbl}}} {value}")
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, value.buckets):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{lbl},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{lbl},le="+Inf"}} {value.count}')
+            lines.append(f"{name}_sum{{{lbl}}} {value.sum:.6f}")
+            lines.append(f"{name}_count{{{lbl}}} {value.count}")
+
+    for name, (help_text, key, collect) in sorted(_gauges.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for label, value in collect().items():
+            lbl = f'{{{key}="{_escape(str(label))}"}}' if key else ""
+            lines.append(f"{name}{lbl} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Middleware ----------
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware роутера: считает все события, дошедшие до роутера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        inc("bot_updates_total", type(event).__name__)
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware роутера: время и ошибки конкретного хендлера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # CallbackDispatcher подставляет имя хендлера, выбранного по коду операции
+        name = data.get("handler_name") or data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            inc("bot_handler_errors_total", name)
+            raise
+        finally:
+            observe("bot_handler_seconds", name, time.perf_counter() - started)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время запросов к Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            inc("bot_api_errors_total", name)
+            raise
+        finally:
+            observe("bot_api_seconds", name, time.perf_counter() - started)
+
+
+def instrument(router):
+    """Подключить метрики к роутеру (до остальных inner-middleware, чтобы мерить их тоже)."""
+    for observer in (router.message, router.callback_query, router.inline_query):
+        observer.outer_middleware(UpdateMetricsMiddleware())
+        observer.middleware(HandlerMetricsMiddleware())
+
+
+# ---------- HTTP ----------
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def serve(host: str, port: int, path: str = "/metrics") -> web.AppRunner:
+    """Поднять отдельный HTTP-сервер с метриками. Вернёт runner для cleanup()."""
+    app = web.Application()
+    app.router.add_get(path, _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -0,0 +1,126 @@
+"""Готовые страницы списков: текст и клавиатура на каждую (вид, страницу).
+
+Контент меняется только когда его правит админ, а листают его постоянно.
+Поэтому страницы собираются один раз на снимок каталога — в потоке БД,
+сразу после catalog.rebuild — и хендлеру остаётся найти готовую страницу
+и отправить её. Курсор превращается в позицию строки бинарным поиском,
+ключ страницы — (вид, позиция, номер страницы).
+
+Сразу строятся первые PRERENDER_PAGES страниц каждого вида; более глубокие
+собираются при первом обращении и запоминаются до следующей смены контента.
+"""
+from typing import NamedTuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+import catalog
+import tenants
+from database import Page
+from keyboards import (
+    get_user_reviews_keyboard, get_user_services_keyboard, get_user_gifts_keyboard,
+    get_services_view_keyboard, get_gifts_view_keyboard,
+)
+
+PAGE_SIZE = 5
+PRERENDER_PAGES = 100   # страниц каждого вида, собираемых при смене контента
+LAZY_LIMIT = 2048       # остальных страниц в памяти на одну версию каталога
+
+
+class Rendered(NamedTuple):
+    text: str
+    markup: InlineKeyboardMarkup
+    page: Page
+
+
+# ---------- Отрисовка ----------
+
+def _item_blocks(p: Page) -> str:
+    blocks = []
+    for _id, name, desc, file_path in p.items:
+        line = f"• <b>{name}</b>\n{desc[:300]}"
+        if file_path:
+            line += "\n📎 есть вложение"
+        blocks.append(line)
+    return "\n\n".join(blocks)
+
+
+def _u_reviews(p: Page) -> tuple[str, InlineKeyboardMarkup]:
+    text = (
+        f"💬 <b>Отзывы</b> — страница <b>{p.page+1}</b>\n\n"
+        "Выберите отзыв, чтобы открыть его целиком."
+    )
+    return text, get_user_reviews_keyboard(p)
+
+
+def _u_services(p: Page) -> tuple[str, InlineKeyboardMarkup]:
+    text = f"🛠 <b>Услуги</b> — страница <b>{p.page+1}</b>\nВыберите карточку ниже."
+    return text, get_user_services_keyboard(p)
+
+
+def _u_gifts(p: Page) -> tuple[str, InlineKeyboardMarkup]:
+    text = f"🎁 <b>Подарки</b> — страница <b>{p.page+1}</b>\nВыберите карточку ниже."
+    return text, get_user_gifts_keyboard(p)
+
+
+def _services_view(p: Page) -> tuple[str, InlineKeyboardMarkup]:
+    text = f"👀 <b>Список услуг</b> — страница <b>{p.page+1}</b>\n\n" + _item_blocks(p)
+    return text, get_services_view_keyboard(p)
+
+
+def _gifts_view(p: Page) -> tuple[str, InlineKeyboardMarkup]:
+    text = f"👀 <b>Список подарков</b> — страница <b>{p.page+1}</b>\n\n" + _item_blocks(p)
+    return text, get_gifts_view_keyboard(p)
+
+
+# вид -> (раздел каталога, отрисовка страницы)
+VIEWS = {
+    "u_reviews": ("reviews", _u_reviews),
+    "u_services": ("services", _u_services),
+    "u_gifts": ("gifts", _u_gifts),
+    "services_view": ("services", _services_view),
+    "gifts_view": ("gifts", _gifts_view),
+}
+
+
+# ---------- Хранилище ----------
+
+# имя бота -> (версия каталога, {(вид, позиция, страница): Rendered})
+_stores: dict[str, tuple[int, dict]] = {}
+
+
+def _render(view: str, section, start: int, page: int) -> Rendered | None:
+    p = section.window(start, page, PAGE_SIZE)
+    if not p.items:
+        return None
+    text, markup = VIEWS[view][1](p)
+    return Rendered(text, markup, p)
+
+
+@catalog.on_rebuild
+def materialize(snapshot: catalog.Catalog):
+    """Собрать первые страницы всех видов для нового снимка (в потоке БД)."""
+    rendered = {}
+    for view, (section_name, _) in VIEWS.items():
+        section = getattr(snapshot, section_name)
+        for page in range(min(PRERENDER_PAGES, -(-section.total // PAGE_SIZE))):
+            start = page * PAGE_SIZE
+            rendered[(view, start, page)] = _render(view, section, start, page)
+    _stores[tenants.current().name] = (snapshot.version, rendered)
+
+
+def get(view: str, page: int = 0, cursor: str | None = None) -> Rendered | None:
+    """Готовая страница вида view или None, если на ней нет строк."""
+    snapshot = catalog.current()
+    section = getattr(snapshot, VIEWS[view][0])
+    start, page = section.locate(page, cursor, PAGE_SIZE)
+    key = (view, start, page)
+    version, rendered = _stores.get(tenants.current().name, (-1, {}))
+    if version != snapshot.version:
+        # Снимок и страницы меняются не одновременно — короткое окно без кэша
+        return _render(view, section, start, page)
+    if key in rendered:
+        return rendered[key]
+    result = _render(view, section, start, page)
+    if len(rendered) < LAZY_LIMIT + PRERENDER_PAGES * len(VIEWS):
+        rendered[key] = result
+    return result
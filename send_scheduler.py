@@ -0,0 +1,199 @@
+"""Планировщик исходящих запросов к Bot API.
+
+Подключается к сессии бота (bot.session.middleware(scheduler)) и пропускает
+отправки сообщений через token bucket'ы:
+
+* общий — ~30 сообщений в секунду на бота;
+* на чат — 1/с в личке, 20/мин в группах (с небольшим запасом на всплеск).
+
+Корзины ведутся отдельно для каждого бота (по bot.id), поэтому один
+планировщик обслуживает и общую HTTP-сессию нескольких ботов (tenants).
+
+Ответы пользователю (INTERACTIVE) идут раньше фоновой работы (BACKGROUND):
+фон берёт токен из общего бюджета, только если интерактивных ожидающих нет
+и в бюджете остаётся резерв. На 429 ждём retry_after и повторяем запрос.
+
+    with send_scheduler.background():
+        await bot.copy_message(...)
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+
+GLOBAL_RATE = 30.0          # сообщений в секунду на бота
+GLOBAL_BURST = 30
+PRIVATE_RATE = 1.0          # в одну личку
+PRIVATE_BURST = 3
+GROUP_RATE = 20 / 60        # в одну группу/канал
+GROUP_BURST = 3
+BACKGROUND_RESERVE = 5      # токенов общего бюджета, которые фон не трогает
+MAX_RETRIES = 3             # повторов после 429
+IDLE_BUCKETS_LIMIT = 10000  # после стольких чатов чистим полные (простаивающие) корзины
+
+# Что тарифицируем: всё, что создаёт или меняет сообщения
+PACED_PREFIXES = ("Send", "Copy", "Forward", "Edit")
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Запросы внутри блока — фоновые (рассылки и т. п.)."""
+    token = send_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, need: float = 1.0) -> float:
+        """Сколько ждать, пока в корзине будет need токенов (0 — можно сейчас)."""
+        self._refill(now)
+        pause = self.paused_until - now
+        lack = (need - self.tokens) / self.rate if self.tokens < need else 0.0
+        return max(pause, lack, 0.0)
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self):
+        self.bots: dict[int, TokenBucket] = {}                    # bot.id -> общий бюджет бота
+        self.chats: dict[tuple[int, int | str], TokenBucket] = {}  # (bot.id, chat_id) -> бюджет чата
+        self.waiting: dict[tuple[int, int], int] = {}              # (bot.id, приоритет) -> ожидающих
+        # метрики
+        self.sent = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.retries = 0
+        self.flood_errors = 0
+
+    def _bot_bucket(self, bot_id: int) -> TokenBucket:
+        bucket = self.bots.get(bot_id)
+        if bucket is None:
+            bucket = self.bots[bot_id] = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        return bucket
+
+    def _chat_bucket(self, bot_id: int, chat_id) -> TokenBucket:
+        bucket = self.chats.get((bot_id, chat_id))
+        if bucket is None:
+            if len(self.chats) >= IDLE_BUCKETS_LIMIT:
+                now = time.monotonic()
+                self.chats = {k: b for k, b in self.chats.items() if not b.idle(now)}
+            private = isinstance(chat_id, int) and chat_id > 0
+            bucket = self.chats[(bot_id, chat_id)] = (
+                TokenBucket(PRIVATE_RATE, PRIVATE_BURST) if private else TokenBucket(GROUP_RATE, GROUP_BURST)
+            )
+        return bucket
+
+    async def _acquire(self, bot_id: int, chat_id, priority: int):
+        total = self._bot_bucket(bot_id)
+        chat = self._chat_bucket(bot_id, chat_id) if chat_id is not None else None
+        started = time.monotonic()
+        key = (bot_id, priority)
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        try:
+            while True:
+                now = time.monotonic()
+                need = 1.0
+                if priority == BACKGROUND:
+                    need += BACKGROUND_RESERVE
+                wait = total.wait_time(now, need)
+                if chat is not None:
+                    wait = max(wait, chat.wait_time(now))
+                if priority == BACKGROUND and self.waiting.get((bot_id, INTERACTIVE)):
+                    wait = max(wait, 1 / GLOBAL_RATE)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting[key] -= 1
+
+        total.take()
+        if chat is not None:
+            chat.take()
+        delay = time.monotonic() - started
+        if delay > 0.001:
+            self.waited += 1
+            self.wait_total += delay
+            self.wait_max = max(self.wait_max, delay)
+
+    def _flood(self, bot_id: int, chat_id, retry_after: float):
+        self.flood_errors += 1
+        now = time.monotonic()
+        if chat_id is not None:
+            self._chat_bucket(bot_id, chat_id).pause(now, retry_after)
+        else:
+            self._bot_bucket(bot_id).pause(now, retry_after)
+
+    async def __call__(self, make_request, bot, method):
+        if not type(method).__name__.startswith(PACED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = send_priority.get()
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(bot.id, chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as err:
+                self._flood(bot.id, chat_id, err.retry_after)
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                logging.warning("flood control: %s in chat %s, retry in %ss",
+                                type(method).__name__, chat_id, err.retry_after)
+                continue
+            self.sent += 1
+            return response
+
+    def stats(self) -> dict:
+        """Снимок метрик: глубина очередей и время ожидания."""
+        return {
+            "queue_interactive": sum(n for (_, p), n in self.waiting.items() if p == INTERACTIVE),
+            "queue_background": sum(n for (_, p), n in self.waiting.items() if p == BACKGROUND),
+            "sent": self.sent,
+            "waited": self.waited,
+            "wait_seconds_total": round(self.wait_total, 3),
+            "wait_seconds_max": round(self.wait_max, 3),
+            "retries": self.retries,
+            "flood_errors": self.flood_errors,
+            "chats_tracked": len(self.chats),
+        }
+
+
+# Один на процесс (и на общую сессию): бюджеты Telegram считаются на бота, а не на апдейт
+scheduler = SendScheduler()
+metrics.register_gauge("bot_send_scheduler", "Send scheduler state, see SendScheduler.stats()", "stat", scheduler.stats)
@@ -0,0 +1,112 @@
+"""Несколько ботов (брендов) в одном процессе.
+
+BOTS_CONFIG указывает на JSON со списком ботов:
+
+    {"bots": [
+        {"name": "spa", "token": "123:AAA…", "admin_ids": [111],
+         "contact_url": "https://t.me/spa_admin", "contact_button_text": "Написать"},
+        {"name": "nails", "token": "456:BBB…", "admin_ids": [222], "data_dir": "/srv/nails"}
+    ]}
+
+У каждого бота свои данные: <data_dir>/bot.db и <data_dir>/media
+(по умолчанию data_dir = data/<name>). Общие на всех — поток БД, пул
+обработки картинок, HTTP-сессия к Bot API, Dispatcher с router и кэши
+(их ключи включают имя бота).
+
+Текущий бот живёт в contextvar: TenantDispatcher выставляет его на каждый
+апдейт, задачи наследуют его при создании, async_db переносит его в поток
+БД. Без BOTS_CONFIG работает один бот из переменных окружения, как раньше:
+bot.db и media/ в корне проекта.
+"""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from aiogram import Bot, Dispatcher
+
+from config import ADMIN_IDS, BOT_TOKEN, CONTACT_BUTTON_TEXT, CONTACT_URL
+
+
+@dataclass(frozen=True)
+class Tenant:
+    name: str
+    token: str
+    admin_ids: tuple[int, ...]
+    contact_url: str
+    contact_button_text: str
+    db_path: str | None     # None — database.DB_PATH
+    media_root: str
+
+
+DEFAULT = Tenant(
+    name="default",
+    token=BOT_TOKEN,
+    admin_ids=tuple(ADMIN_IDS),
+    contact_url=CONTACT_URL,
+    contact_button_text=CONTACT_BUTTON_TEXT,
+    db_path=None,
+    media_root="media",
+)
+
+_current: ContextVar[Tenant] = ContextVar("tenant", default=DEFAULT)
+_by_bot_id: dict[int, Tenant] = {}
+
+
+def current() -> Tenant:
+    """Бот, в контексте которого выполняется код."""
+    return _current.get()
+
+
+@contextmanager
+def use(tenant: Tenant):
+    """Выполнить блок (и созданные в нём задачи) от имени tenant."""
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def load(path: str | None) -> list[Tenant]:
+    """Боты из JSON-конфига; без конфига — единственный бот из окружения."""
+    if not path:
+        return [DEFAULT]
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["bots"]
+
+    result = []
+    for entry in entries:
+        name = entry["name"]
+        data_dir = entry.get("data_dir") or os.path.join("data", name)
+        result.append(Tenant(
+            name=name,
+            token=entry["token"],
+            admin_ids=tuple(int(x) for x in entry.get("admin_ids", ())),
+            contact_url=entry.get("contact_url", CONTACT_URL),
+            contact_button_text=entry.get("contact_button_text", CONTACT_BUTTON_TEXT),
+            db_path=os.path.join(data_dir, "bot.db"),
+            media_root=os.path.join(data_dir, "media"),
+        ))
+    names = [t.name for t in result]
+    if not result or len(set(names)) != len(names):
+        raise ValueError(f"{path}: bot names must be present and unique, got {names}")
+    return result
+
+
+def bind(bot: Bot, tenant: Tenant):
+    """Запомнить, чьи апдейты приходят этому боту."""
+    _by_bot_id[bot.id] = tenant
+
+
+class TenantDispatcher(Dispatcher):
+    """Dispatcher, который обрабатывает каждый апдейт в контексте его бота.
+
+    Контекст выставляется до middleware диспетчера — FSM читает состояние
+    уже из БД нужного бота.
+    """
+
+    async def feed_update(self, bot: Bot, update, **kwargs):
+        with use(_by_bot_id.get(bot.id, DEFAULT)):
+            return await super().feed_update(bot, update, **kwargs)
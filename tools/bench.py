@@ -0,0 +1,280 @@
+"""Нагрузочный прогон бота без Telegram.
+
+Поднимает настоящие Dispatcher + router из handlers.py на временной БД,
+наполняет каталог и скармливает через feed_update синтетические апдейты:
+/start, кнопки разделов, листание страниц и открытие карточек. Сессия бота
+подменена заглушкой: запросы к Bot API только считаются (и по желанию
+«висят» --api-latency мс).
+
+    python tools/bench.py                       # 2000 апдейтов, 50 параллельно, 200 карточек в разделе
+    python tools/bench.py -n 20000 -c 200 --catalog 5000
+    python tools/bench.py --api-latency 30      # с имитацией сетевой задержки Bot API
+
+Печатает пропускную способность и p50/p95/p99 времени обработки апдейта —
+всего и по видам действий, а также цену страницы списка: сборка с нуля
+против готовой страницы из pages.py.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import (
+    CallbackQuery, Chat, Document, File, Message, MessageId, PhotoSize, Update, User
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # картинки разделов лежат в media/img относительно корня
+
+import async_db  # noqa: E402
+import callbacks  # noqa: E402
+import catalog  # noqa: E402
+import database  # noqa: E402
+import events  # noqa: E402
+import pages  # noqa: E402
+import users  # noqa: E402
+from fsm_storage import SQLiteStorage  # noqa: E402
+from handlers import PAGE_SIZE, router  # noqa: E402
+
+_ids = itertools.count(1)
+
+SECTIONS = {
+    # раздел: (кнопка, код листания, код карточки)
+    "reviews": ("💬 Отзывы", callbacks.U_REVIEWS_PAGE, callbacks.U_REVIEW),
+    "services": ("🛠 Услуги", callbacks.U_SERVICES_PAGE, callbacks.U_SERVICE),
+    "gifts": ("🎁 Подарок", callbacks.U_GIFTS_PAGE, callbacks.U_GIFT),
+}
+
+# Доля каждого действия в потоке апдейтов
+MIX = {"start": 1, "section": 3, "page": 4, "card": 4, "contacts": 1}
+
+
+class FakeSession(BaseSession):
+    """Сессия-заглушка: отвечает правдоподобными объектами и считает вызовы."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def close(self):
+        pass
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat = Chat(id=getattr(method, "chat_id", None) or 1, type="private")
+        if name == "SendPhoto":
+            photo = [PhotoSize(file_id=f"photo-{next(_ids)}", file_unique_id="u", width=1, height=1)]
+            return Message(message_id=next(_ids), date=0, chat=chat, photo=photo)
+        if name == "SendDocument":
+            document = Document(file_id=f"doc-{next(_ids)}", file_unique_id="u")
+            return Message(message_id=next(_ids), date=0, chat=chat, document=document)
+        if name in ("SendMessage", "EditMessageText", "EditMessageCaption", "EditMessageReplyMarkup"):
+            return Message(message_id=next(_ids), date=0, chat=chat, text=getattr(method, "text", None))
+        if name == "CopyMessage":
+            return MessageId(message_id=next(_ids))
+        if name == "GetFile":
+            return File(file_id=method.file_id, file_unique_id="u", file_path="x", file_size=1)
+        if name == "GetMe":
+            return User(id=42, is_bot=True, first_name="bench", username="bench_bot")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+
+# ---------- Данные ----------
+
+def seed(size: int):
+    """Наполнить разделы одной транзакцией (add_* пересобирали бы каталог на каждую строку)."""
+    now = int(time.time())
+    with database.write_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO reviews (author, text, date, created_ts) VALUES (?, ?, ?, ?)",
+            [(f"Автор {i}", "Отличный сервис! " * 10, "01.01.2025", now - i) for i in range(size)]
+        )
+        for table in ("services", "gifts"):
+            conn.executemany(
+                f"INSERT INTO {table} (name, description, file_path, created_ts) VALUES (?, ?, NULL, ?)",
+                [(f"{table} {i}", "Описание " * 30, now - i) for i in range(size)]
+            )
+    catalog.rebuild()
+
+
+def walk_pages(section: str) -> list:
+    """Все страницы раздела как (page, cursor, anchor, ids) — из них собираются callback'и."""
+    sect = getattr(catalog.current(), section)
+    pages, page, cursor = [], 0, None
+    while True:
+        p = sect.page(page, cursor, PAGE_SIZE)
+        if not p.items:
+            return pages
+        pages.append((p.page, cursor, p.anchor, [row[0] for row in p.items]))
+        if not p.next_cursor:
+            return pages
+        page, cursor = page + 1, p.next_cursor
+
+
+# ---------- Апдейты ----------
+
+def _user(uid: int) -> User:
+    return User(id=uid, is_bot=False, first_name="bench")
+
+
+def message_update(uid: int, text: str) -> Update:
+    return Update(update_id=next(_ids), message=Message(
+        message_id=next(_ids), date=0, chat=Chat(id=uid, type="private"), from_user=_user(uid), text=text
+    ))
+
+
+def callback_update(uid: int, data: str) -> Update:
+    message = Message(message_id=next(_ids), date=0, chat=Chat(id=uid, type="private"), text="bench")
+    return Update(update_id=next(_ids), callback_query=CallbackQuery(
+        id=str(next(_ids)), from_user=_user(uid), chat_instance="bench", message=message, data=data
+    ))
+
+
+def generate(count: int, users: int, pages: dict, rng: random.Random) -> list[tuple[str, Update]]:
+    kinds = list(MIX)
+    weights = [MIX[k] for k in kinds]
+    result = []
+    for _ in range(count):
+        uid = rng.randint(1, users) + 10_000_000
+        kind = rng.choices(kinds, weights)[0]
+        section = rng.choice(list(SECTIONS))
+        button, page_op, card_op = SECTIONS[section]
+        if kind == "start":
+            update = message_update(uid, "/start")
+        elif kind == "contacts":
+            update = message_update(uid, "📞 Контакты")
+        elif kind == "section" or not pages[section]:
+            kind, update = "section", message_update(uid, button)
+        elif kind == "page":
+            page, cursor, _, _ = rng.choice(pages[section])
+            update = callback_update(uid, callbacks.pack(page_op, page, cursor))
+        else:
+            page, _, anchor, ids = rng.choice(pages[section])
+            update = callback_update(uid, callbacks.pack(card_op, rng.choice(ids), page, anchor))
+        result.append((kind, update))
+    return result
+
+
+# ---------- Страницы ----------
+
+def page_report(rounds: int = 5):
+    """Сколько стоит страница списка: отрисовка на каждое нажатие против готовой из pages."""
+    snap = catalog.current()
+    started = time.perf_counter()
+    pages.materialize(snap)
+    build = time.perf_counter() - started
+
+    requests = []
+    for view, (section, _) in pages.VIEWS.items():
+        for page, cursor, _, _ in walk_pages(section)[:pages.PRERENDER_PAGES]:
+            requests.append((view, page, cursor))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for view, page, cursor in requests:
+            section, render = pages.VIEWS[view]
+            render(getattr(snap, section).page(page, cursor, PAGE_SIZE))
+    rendered = (time.perf_counter() - started) / (rounds * len(requests))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for view, page, cursor in requests:
+            pages.get(view, page, cursor)
+    lookup = (time.perf_counter() - started) / (rounds * len(requests))
+
+    print(f"pages: {len(requests)} prebuilt in {build * 1000:.1f} ms (off the hot path); "
+          f"per tap: render {rendered * 1e6:.1f} µs -> lookup {lookup * 1e6:.1f} µs")
+
+
+# ---------- Прогон ----------
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def report(title: str, latencies: list[float]):
+    latencies.sort()
+    print(f"  {title:<10} n={len(latencies):<7} "
+          f"p50={_percentile(latencies, 0.5):7.2f} ms  "
+          f"p95={_percentile(latencies, 0.95):7.2f} ms  "
+          f"p99={_percentile(latencies, 0.99):7.2f} ms")
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    database.DB_PATH = os.path.join(workdir, "bench.db")
+    try:
+        await async_db.run(database.init_db)
+        await async_db.run(seed, args.catalog)
+        pages = {section: walk_pages(section) for section in SECTIONS}
+
+        session = FakeSession(args.api_latency / 1000)
+        bot = Bot("42:BENCH", session=session)
+        dp = Dispatcher(storage=SQLiteStorage())
+        dp.include_router(router)
+
+        rng = random.Random(args.seed)
+        warmup = generate(min(200, args.count), args.users, pages, rng)
+        updates = generate(args.count, args.users, pages, rng)
+        for _, update in warmup:  # прогрев: кэши клавиатур и file_id
+            await dp.feed_update(bot, update)
+        session.calls.clear()
+
+        latencies: dict[str, list[float]] = defaultdict(list)
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one(kind: str, update: Update):
+            async with sem:
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies[kind].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(kind, update) for kind, update in updates))
+        elapsed = time.perf_counter() - started
+
+        print(f"catalog: {args.catalog} per section, users: {args.users}, "
+              f"concurrency: {args.concurrency}, api latency: {args.api_latency} ms")
+        print(f"{args.count} updates in {elapsed:.2f}s — {args.count / elapsed:.0f} upd/s")
+        report("all", [x for values in latencies.values() for x in values])
+        for kind in MIX:
+            if latencies[kind]:
+                report(kind, latencies[kind])
+        print("api calls:", ", ".join(f"{name}={n}" for name, n in session.calls.most_common()))
+        page_report()
+        await users.flush()
+        await events.flush()
+    finally:
+        async_db.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=2000, help="сколько апдейтов отправить")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="апдейтов в обработке одновременно")
+    parser.add_argument("--catalog", type=int, default=200, help="карточек в каждом разделе")
+    parser.add_argument("--users", type=int, default=1000, help="сколько разных пользователей")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Локальная замена Telegram для проверки вебхука.
+
+Шлёт синтетические апдейты на запущенный `BOT_MODE=webhook python bot.py`
+(с WEBHOOK_URL="" — чтобы бот не регистрировал вебхук) и печатает коды
+ответов и время подтверждения.
+
+    python tools/webhook_stub.py --url http://127.0.0.1:8080/webhook --secret s3cr3t -n 200 -c 20
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+from aiohttp import ClientSession
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+def make_update(user_id: int, text: str) -> dict:
+    n = next(_ids)
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "stub"},
+            "text": text,
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    parser.add_argument("-n", "--count", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    texts = ["/start", "💬 Отзывы", "🛠 Услуги", "🎁 Подарок", "📞 Контакты"]
+    statuses: dict[int, int] = {}
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async with ClientSession() as session:
+        async def post(i: int):
+            async with sem:
+                started = time.perf_counter()
+                async with session.post(args.url, json=make_update(100000 + i, texts[i % len(texts)]), headers=headers) as resp:
+                    await resp.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(args.count)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"statuses: {statuses}")
+    print(f"{args.count} updates in {elapsed:.2f}s ({args.count / elapsed:.0f} upd/s)")
+    for q in (0.5, 0.95, 0.99):
+        print(f"p{int(q * 100)} ack: {latencies[int(q * (len(latencies) - 1))] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""Реестр пользователей бота.
+
+cmd_start только отмечает пользователя в памяти (touch), а в таблицу users
+отметки уходят пачкой: раз в FLUSH_INTERVAL секунд или как только
+накопится FLUSH_BATCH. Так всплеск /start не превращается в поток
+одиночных транзакций. Отметки копятся отдельно для каждого бота
+(tenants) и сбрасываются в его БД.
+"""
+import asyncio
+import logging
+import time
+
+import async_db
+import tenants
+
+FLUSH_INTERVAL = 5.0
+FLUSH_BATCH = 500
+
+_pending: dict[str, dict[int, int]] = {}   # имя бота -> {user_id: время последнего /start}
+_tasks: dict[str, asyncio.Task] = {}   # имя бота -> запущенный сброс
+
+
+def touch(user_id: int):
+    name = tenants.current().name
+    pending = _pending.setdefault(name, {})
+    pending[user_id] = int(time.time())
+    if len(pending) >= FLUSH_BATCH and name not in _tasks:  # сброс этого бота уже запущен — не плодим задачи
+        task = _tasks[name] = asyncio.create_task(flush())
+        task.add_done_callback(lambda _: _tasks.pop(name, None))
+
+
+async def flush():
+    """Записать накопленные отметки текущего бота одной транзакцией."""
+    name = tenants.current().name
+    batch = _pending.pop(name, None)
+    if not batch:
+        return
+    try:
+        await async_db.upsert_users(batch)
+    except Exception:
+        # Не теряем отметки: вернём их в очередь (свежие значения важнее)
+        pending = _pending.setdefault(name, {})
+        for user_id, ts in batch.items():
+            pending.setdefault(user_id, ts)
+        raise
+
+
+async def run_flusher(interval: float = FLUSH_INTERVAL):
+    """Фоновая задача бота (запускается в его контексте): периодический сброс отметок в БД."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush()
+        except Exception:
+            logging.exception("users flush failed")